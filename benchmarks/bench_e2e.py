@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of a full auto delete run (scan, score and delete) against the fake_plex stand-in server.
+
+For every library size the tool is copied to a temporary directory, configured against a fresh fake server and run
+in a subprocess. Records wall time, requests made, peak RSS of the run and deletes per second.
+
+Usage: python3 benchmarks/bench_e2e.py [sizes...] [--copies 2] [--latency 0] [--output results.json]
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from fake_plex import FakeLibrary, FakePlexServer  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def build_config(server_url, overrides):
+    with open(os.path.join(REPO_DIR, 'config_sample.json'), 'r') as fp:
+        config = json.load(fp)
+    config.update({
+        'PLEX_SERVER': server_url,
+        'PLEX_TOKEN': 'benchmark',
+        'PLEX_LIBRARIES': ['Movies', 'TV'],
+        'AUTO_DELETE': True,
+        'DELETE_RATE_LIMIT': 0,
+        'LOG_LEVEL': 'INFO',
+    })
+    config.update(overrides)
+    return config
+
+
+def run_tool(work_dir, args):
+    # wait4 gives the resource usage of this one child, RUSAGE_CHILDREN would mix in earlier runs
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(work_dir, 'plex_dupefinder.py')] + args,
+                               cwd=work_dir, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    stderr = process.stderr.read().decode('utf-8', 'replace')
+    process.stderr.close()
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return process.returncode, stderr, elapsed, peak_rss
+
+
+def bench(items, copies, parts, streams, latency, overrides, args, keep=False):
+    library = FakeLibrary(items, copies, parts, streams)
+    server = FakePlexServer(library, latency=latency)
+    server.start()
+    work_dir = tempfile.mkdtemp(prefix='plex_dupefinder_bench_')
+    try:
+        for filename in glob.glob(os.path.join(REPO_DIR, '*.py')):
+            shutil.copy(filename, work_dir)
+        with open(os.path.join(work_dir, 'config.json'), 'w') as fp:
+            json.dump(build_config(server.url, overrides), fp, indent=2)
+
+        returncode, stderr, elapsed, peak_rss = run_tool(work_dir, args)
+        if returncode != 0:
+            raise RuntimeError("Run of %d items failed with exit code %d:\n%s" % (items, returncode, stderr))
+    finally:
+        server.shutdown()
+        server.server_close()
+        if keep:
+            print("Kept run directory %s" % work_dir)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    deletes = len(server.delete_times)
+    delete_span = server.delete_times[-1] - server.delete_times[0] if deletes > 1 else 0
+    return {
+        'items': items,
+        'wall_seconds': round(elapsed, 3),
+        'requests': sum(server.requests.values()),
+        'requests_by_endpoint': {'%s %s' % key: count for key, count in sorted(server.requests.items())},
+        'peak_rss_bytes': peak_rss,
+        'deletes': deletes,
+        'expected_deletes': items * (copies - 1),
+        'deletes_per_second': round(deletes / delete_span, 1) if delete_span else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark full runs against a fake Plex server.")
+    parser.add_argument('sizes', nargs='*', type=int, default=[1000, 10000, 100000],
+                        help="duplicate titles per run (default: 1000 10000 100000)")
+    parser.add_argument('--copies', type=int, default=2, help="media items per title (default: %(default)s)")
+    parser.add_argument('--parts', type=int, default=1, help="parts per media item (default: %(default)s)")
+    parser.add_argument('--streams', type=int, default=2, help="audio streams per part (default: %(default)s)")
+    parser.add_argument('--latency', type=float, default=0, help="milliseconds added to every request")
+    parser.add_argument('--config', default='{}',
+                        help="JSON object of config.json settings to override, e.g. '{\"METADATA_WORKERS\": 8}'")
+    parser.add_argument('--args', default='', help="extra arguments for plex_dupefinder.py")
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    parser.add_argument('--keep', action='store_true', help="keep the run directories (logs, decisions...)")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        result = bench(size, args.copies, args.parts, args.streams, args.latency / 1000.0, json.loads(args.config),
+                       args.args.split(), args.keep)
+        results.append(result)
+        print("%7d items: %8.2fs wall, %6d requests, %7.1f MB peak RSS, %d/%d deletes at %s/s"
+              % (size, result['wall_seconds'], result['requests'], result['peak_rss_bytes'] / 1048576.0,
+                 result['deletes'], result['expected_deletes'], result['deletes_per_second']))
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2)
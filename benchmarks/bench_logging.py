@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the scoring hot path with logging off, with the old synchronous DEBUG file handler and with the
+queue based handler at DEBUG and INFO level, on the local disk and on a slow one (every write of a line waits
+[slow disk ms], like a busy network share).
+
+Times are those of the scan itself and, in brackets, until the whole log is written.
+
+Usage: python3 benchmarks/bench_logging.py [parts] [filename rules] [slow disk ms]
+"""
+import atexit
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from bench_scoring import build_config, build_media_info  # noqa: E402
+from logger import LOG_DATE_FORMAT, LOG_FORMAT, setup_logging  # noqa: E402
+from media import MediaPart  # noqa: E402
+from scoring import MediaScorer  # noqa: E402
+
+log = logging.getLogger("Plex_Dupefinder")
+
+
+def reset_logging():
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(logging.WARNING)
+
+
+@contextmanager
+def slow_disk(delay):
+    # every line written to a log file waits delay seconds, as on a disk that is slow to respond
+    flush = logging.FileHandler.flush
+
+    def slow_flush(handler):
+        time.sleep(delay)
+        flush(handler)
+
+    logging.FileHandler.flush = slow_flush
+    try:
+        yield
+    finally:
+        logging.FileHandler.flush = flush
+
+
+def scan(scorer, parts):
+    # what scanning and scoring does per part, minus talking to Plex
+    start = time.perf_counter()
+    for part in parts:
+        score = scorer.score(part)
+        log.info("ID: %r - Score: %s - Meta:\n%r", part.id, score, part)
+    return time.perf_counter() - start
+
+
+def run_handlers(scorer, parts, tmp_dir, name):
+    results = []
+    logging.basicConfig(filename=os.path.join(tmp_dir, '%s_sync.log' % name), level=logging.DEBUG,
+                        format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+    elapsed = scan(scorer, parts)
+    results.append(("DEBUG, synchronous file handler", elapsed, elapsed))
+    reset_logging()
+
+    for level in ('DEBUG', 'INFO'):
+        start = time.perf_counter()
+        listener = setup_logging(os.path.join(tmp_dir, '%s_queue_%s.log' % (name, level.lower())), level)
+        elapsed = scan(scorer, parts)
+        atexit.unregister(listener.stop)
+        listener.stop()
+        results.append(("%s, queue handler" % level, elapsed, time.perf_counter() - start))
+        reset_logging()
+    return results
+
+
+if __name__ == "__main__":
+    part_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rule_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    slow_disk_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 0.2
+
+    rng = random.Random(1337)
+    config = build_config(rng, rule_count)
+    parts = [MediaPart.from_dict(build_media_info(rng)) for _ in range(part_count)]
+    scorer = MediaScorer(config)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reset_logging()
+        elapsed = scan(scorer, parts)
+        results = [("logging off", elapsed, elapsed)]
+        results.extend(run_handlers(scorer, parts, tmp_dir, 'local'))
+        with slow_disk(slow_disk_ms / 1000.0):
+            slow_results = run_handlers(scorer, parts, tmp_dir, 'slow')
+
+    print("Scanned %d parts against %d filename rules" % (part_count, rule_count))
+    for name, elapsed, written in results:
+        print("  %-32s: %.3fs (%.3fs)" % (name, elapsed, written))
+    print("On a disk taking %.1f ms per write" % slow_disk_ms)
+    for name, elapsed, written in slow_results:
+        print("  %-32s: %.3fs (%.3fs)" % (name, elapsed, written))
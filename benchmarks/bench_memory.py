@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Memory held by a scan's worth of parts (the process_later dict of titles), as the old per-part info dicts and as
+MediaPart records, measured with tracemalloc.
+
+Usage: python3 benchmarks/bench_memory.py [titles] [copies]
+"""
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from bench_scoring import build_media_info  # noqa: E402
+from media import MediaPart  # noqa: E402
+
+
+def parsed_info(rng, show_key):
+    # strings parsed from a Plex response are separate objects per part, the sample lists would share them
+    info = build_media_info(rng)
+    for key in ('audio_codec', 'video_codec', 'video_resolution'):
+        info[key] = info[key].encode().decode()
+    info['score'] = rng.randint(0, 10 ** 6)
+    info['show_key'] = show_key
+    return info
+
+
+def build_dicts(titles, copies):
+    rng = random.Random(1337)
+    process_later = {}
+    for title in range(titles):
+        show_key = '/library/metadata/%d' % title
+        process_later['Title %d' % title] = {pos: parsed_info(rng, show_key) for pos in range(copies)}
+    return process_later
+
+
+def build_parts(titles, copies):
+    rng = random.Random(1337)
+    process_later = {}
+    for title in range(titles):
+        show_key = '/library/metadata/%d' % title
+        process_later['Title %d' % title] = {pos: MediaPart.from_dict(parsed_info(rng, show_key))
+                                             for pos in range(copies)}
+    return process_later
+
+
+def measure(build, titles, copies):
+    tracemalloc.start()
+    process_later = build(titles, copies)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del process_later
+    return current, peak
+
+
+if __name__ == "__main__":
+    title_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    copy_count = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    part_count = title_count * copy_count
+
+    results = [(name, measure(build, title_count, copy_count))
+               for name, build in (('info dicts', build_dicts), ('MediaPart', build_parts))]
+
+    print("Held %d parts of %d titles" % (part_count, title_count))
+    for name, (current, peak) in results:
+        print("  %-10s: %7.1f MB held (%4d bytes per part), %7.1f MB peak"
+              % (name, current / 1048576.0, current / part_count, peak / 1048576.0))
+    print("  saved     : %.0f%%" % (100 - 100.0 * results[1][1][0] / results[0][1][0]))
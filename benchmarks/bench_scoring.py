@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the compiled scorer against the original per-call get_score, and for batch scoring (with
+numpy when it is installed, and in plain Python).
+
+Usage: python3 benchmarks/bench_scoring.py [parts] [filename rules]
+"""
+import os
+import random
+import sys
+import time
+from fnmatch import fnmatch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import scoring  # noqa: E402
+from media import MediaPart  # noqa: E402
+from scoring import MediaScorer  # noqa: E402
+
+CODECS_AUDIO = ['aac', 'AC3', 'dca', 'dca-ma', 'eac3', 'flac', 'truehd', 'opus', 'Unknown']
+CODECS_VIDEO = ['h264', 'HEVC', 'h265', 'mpeg4', 'vc1', 'av1', 'Unknown']
+RESOLUTIONS = ['4k', '1080', '720', '480', 'SD', 'Unknown']
+TOKENS = ['Remux', 'BluRay', 'WEB', 'WEB-DL', 'HDTV', 'dvd', 'REPACK', 'PROPER', 'x264', 'x265', 'NTB', 'VISUM',
+          'KINGS', 'SiGMA', 'QOQ', 'TBS', 'CasStudio', '1080p', '720p', '2160p']
+EXTENSIONS = ['mkv', 'mp4', 'avi', 'ts', 'vob']
+
+
+def legacy_score(config, media_info):
+    """ get_score as it was before the compiled scorer, minus the debug logging. """
+    score = 0
+    for codec, codec_score in config['AUDIO_CODEC_SCORES'].items():
+        if codec.lower() == media_info['audio_codec'].lower():
+            score += int(codec_score)
+            break
+    for codec, codec_score in config['VIDEO_CODEC_SCORES'].items():
+        if codec.lower() == media_info['video_codec'].lower():
+            score += int(codec_score)
+            break
+    for resolution, resolution_score in config['VIDEO_RESOLUTION_SCORES'].items():
+        if resolution.lower() == media_info['video_resolution'].lower():
+            score += int(resolution_score)
+            break
+    for filename_keyword, keyword_score in config['FILENAME_SCORES'].items():
+        for filename in media_info['file']:
+            if fnmatch(os.path.basename(filename.lower()), filename_keyword.lower()):
+                score += int(keyword_score)
+    score += int(media_info['video_bitrate']) * 2
+    score += int(media_info['video_duration']) / 300
+    score += int(media_info['video_width']) * 2
+    score += int(media_info['video_height']) * 2
+    score += int(media_info['audio_channels']) * 1000
+    if config['SCORE_FILESIZE']:
+        score += int(media_info['file_size']) / 100000
+    return int(score)
+
+
+def build_config(rng, rule_count):
+    filename_scores = {}
+    while len(filename_scores) < rule_count:
+        glob = '*' + '*'.join(rng.sample(TOKENS, rng.randint(1, 2))) + '*'
+        if rng.random() < 0.2:
+            glob = '*.' + rng.choice(EXTENSIONS) + ('' if rng.random() < 0.5 else '*')
+        filename_scores[glob] = rng.randint(-5000, 20000)
+    return {
+        'AUDIO_CODEC_SCORES': {'Unknown': 0, 'wmapro': 200, 'mp2': 500, 'mp3': 1000, 'ac3': 1000, 'dca': 2000,
+                               'pcm': 2500, 'flac': 2500, 'dca-ma': 4000, 'truehd': 4500, 'aac': 1000, 'eac3': 1250},
+        'VIDEO_CODEC_SCORES': {'Unknown': 0, 'h264': 10000, 'h265': 5000, 'hevc': 5000, 'mpeg4': 500, 'vc1': 3000,
+                               'vp9': 1000, 'mpeg1video': 250, 'mpeg2video': 250, 'wmv2': 250, 'wmv3': 250,
+                               'msmpeg4': 100, 'msmpeg4v2': 100, 'msmpeg4v3': 100},
+        'VIDEO_RESOLUTION_SCORES': {'Unknown': 0, '4k': 20000, '1080': 10000, '720': 5000, '480': 3000, 'sd': 1000},
+        'FILENAME_SCORES': filename_scores,
+        'SCORE_FILESIZE': True,
+    }
+
+
+def build_media_info(rng):
+    files = []
+    for _ in range(rng.choice([1, 1, 1, 2])):
+        name = '.'.join(['Some.Show.S01E01'] + rng.sample(TOKENS, 4)) + '.' + rng.choice(EXTENSIONS)
+        files.append('/mnt/media/TV/Some Show/Season 01/' + name)
+    return {
+        'id': rng.randint(1, 10 ** 6),
+        'video_bitrate': rng.randint(500, 40000),
+        'audio_codec': rng.choice(CODECS_AUDIO),
+        'audio_channels': rng.choice([2, 6, 8]),
+        'video_codec': rng.choice(CODECS_VIDEO),
+        'video_resolution': rng.choice(RESOLUTIONS),
+        'video_width': rng.choice([720, 1280, 1920, 3840]),
+        'video_height': rng.choice([480, 720, 1080, 2160]),
+        'video_duration': rng.randint(10 ** 6, 10 ** 7),
+        'file': files,
+        'multipart': len(files) > 1,
+        'file_size': rng.randint(10 ** 8, 10 ** 11),
+    }
+
+
+def timed(func, media_infos):
+    start = time.perf_counter()
+    scores = [func(media_info) for media_info in media_infos]
+    return time.perf_counter() - start, scores
+
+
+if __name__ == "__main__":
+    part_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rule_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    rng = random.Random(1337)
+    config = build_config(rng, rule_count)
+    media_infos = [build_media_info(rng) for _ in range(part_count)]
+    parts = [MediaPart.from_dict(media_info) for media_info in media_infos]
+
+    legacy_time, legacy_scores = timed(lambda media_info: legacy_score(config, media_info), media_infos)
+    start = time.perf_counter()
+    scorer = MediaScorer(config)
+    build_time = time.perf_counter() - start
+    compiled_time, compiled_scores = timed(scorer.score, parts)
+
+    batch_times = []
+    numpy = scoring.get_numpy()
+    for name in (('numpy', 'plain python') if numpy is not None else ('plain python',)):
+        # False is how scoring remembers numpy is not installed
+        scoring.numpy = numpy if name == 'numpy' else False
+        start = time.perf_counter()
+        batch_scores = scorer.score_batch(parts)
+        batch_times.append((name, time.perf_counter() - start))
+        if batch_scores != compiled_scores:
+            print("Batch score (%s) mismatch on %d of %d parts!"
+                  % (name, sum(1 for a, b in zip(batch_scores, compiled_scores) if a != b), part_count))
+            sys.exit(1)
+    scoring.numpy = numpy
+
+    if legacy_scores != compiled_scores:
+        mismatches = sum(1 for a, b in zip(legacy_scores, compiled_scores) if a != b)
+        print("Score mismatch on %d of %d parts!" % (mismatches, part_count))
+        sys.exit(1)
+
+    print("Scored %d parts against %d filename rules" % (part_count, rule_count))
+    print("  legacy get_score : %.3fs" % legacy_time)
+    print("  MediaScorer      : %.3fs (+%.3fs build)" % (compiled_time, build_time))
+    print("  speedup          : %.1fx" % (legacy_time / compiled_time))
+    for name, batch_time in batch_times:
+        print("  batch, %-12s: %.3fs (%.1fx)" % (name, batch_time, legacy_time / batch_time))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Startup time budget check: runs plex_dupefinder.py --help under -X importtime and fails when its imports take longer
+than the budget, or when a module that is only needed to talk to Plex (or to score large libraries) is imported.
+
+The interpreter's own imports (site, encodings...) are measured with -c pass and left out. The wall time of the run is
+reported as the best of a few runs, next to the bare interpreter's.
+
+Usage: python3 benchmarks/bench_startup.py [--budget-ms 60] [--runs 5] [--args '--help']
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# imported where they are used, never on the way to parsing the arguments
+DEFERRED_MODULES = ('numpy', 'plexapi', 'requests', 'tabulate', 'urllib3', 'websocket')
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def import_times(args):
+    """ Returns [(module, cumulative microseconds, depth)] of every import made by the python run with args. """
+    process = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=REPO_DIR, stdin=subprocess.DEVNULL,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    imports = []
+    for line in process.stderr.decode('utf-8', 'replace').splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            imports.append((match.group(4), int(match.group(2)), len(match.group(3)) // 2))
+    return imports
+
+
+def best_wall_time(args, runs):
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=REPO_DIR, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the startup time of plex_dupefinder.py against a budget.")
+    parser.add_argument('--budget-ms', type=float, default=60,
+                        help="most milliseconds the tool's own imports may take (default: %(default)s)")
+    parser.add_argument('--runs', type=int, default=5, help="runs to take the best wall time of (default: %(default)s)")
+    parser.add_argument('--args', default='--help', help="arguments for plex_dupefinder.py (default: %(default)s)")
+    args = parser.parse_args()
+
+    tool_args = [os.path.join(REPO_DIR, 'plex_dupefinder.py')] + args.args.split()
+    interpreter_modules = {name for name, _, _ in import_times(['-c', 'pass'])}
+    imports = [entry for entry in import_times(tool_args) if entry[0] not in interpreter_modules]
+    top_level = sorted((entry for entry in imports if entry[2] == 0), key=lambda entry: entry[1], reverse=True)
+    import_ms = sum(cumulative for _, cumulative, _ in top_level) / 1000.0
+    deferred = sorted({name.split('.')[0] for name, _, _ in imports} & set(DEFERRED_MODULES))
+
+    print("Imports of plex_dupefinder.py %s: %.1f ms (budget %.1f ms)" % (args.args, import_ms, args.budget_ms))
+    for name, cumulative, _ in top_level[:10]:
+        print("  %-28s %7.1f ms" % (name, cumulative / 1000.0))
+    print("Wall time: %.1f ms, bare interpreter %.1f ms (best of %d)"
+          % (best_wall_time(tool_args, args.runs) * 1000, best_wall_time(['-c', 'pass'], args.runs) * 1000, args.runs))
+
+    failed = False
+    if import_ms > args.budget_ms:
+        print("Over budget by %.1f ms!" % (import_ms - args.budget_ms))
+        failed = True
+    if deferred:
+        print("Imported modules that should be deferred: %s" % ', '.join(deferred))
+        failed = True
+    sys.exit(1 if failed else 0)
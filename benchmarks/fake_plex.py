@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for a Plex Media Server, serving just enough of the API for plex_dupefinder to scan, score and
+delete: the server root, library sections (with their filter meta), duplicate searches, batched metadata and media
+DELETE requests.
+
+Items are synthetic and generated on request from their ratingKey, so large libraries cost no memory up front.
+Deleted media disappear from later responses. Every request can be delayed to simulate a remote server.
+
+Usage: python3 benchmarks/fake_plex.py [--items 1000] [--copies 2] [--parts 1] [--streams 2] [--same-path] [--latency 0]
+       [--port 32400]
+"""
+import argparse
+import collections
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import quoteattr
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from metrics import normalize_endpoint  # noqa: E402
+
+RESOLUTIONS = [('4k', 3840, 2160, 40000), ('1080', 1920, 1080, 12000), ('720', 1280, 720, 5000),
+               ('sd', 720, 480, 1500)]
+VIDEO_CODECS = ['h264', 'hevc', 'mpeg4', 'vc1']
+AUDIO_CODECS = [('truehd', 8), ('dca', 6), ('ac3', 6), ('eac3', 6), ('aac', 2), ('mp3', 2)]
+RELEASES = ['BluRay-GRP', 'BluRay.Remux-GRP', 'WEB-DL-NTB', 'WEB-DL-TBS', 'HDTV-LOL', 'DVDRip-XYZ', 'PROPER.WEB-KINGS']
+CONTAINERS = ['mkv', 'mkv', 'mp4', 'avi']
+
+FILTER_META = """<Meta>
+<Type key="/library/sections/{key}/all?type=1" type="movie" title="Movies" active="1">
+{fields}</Type>
+<Type key="/library/sections/{key}/all?type=2" type="show" title="TV Shows" active="1">
+{fields}</Type>
+<Type key="/library/sections/{key}/all?type=4" type="episode" title="Episodes" active="0">
+{fields}</Type>
+<FieldType type="boolean"><Operator key="=" title="is"/><Operator key="!=" title="is not"/></FieldType>
+<FieldType type="date"><Operator key="&gt;&gt;=" title="is after"/><Operator key="&lt;&lt;=" title="is before"/>
+</FieldType>
+<FieldType type="integer"><Operator key="=" title="is"/></FieldType>
+<FieldType type="string"><Operator key="=" title="contains"/><Operator key="==" title="is"/></FieldType>
+</Meta>"""
+FILTER_FIELDS = ('<Field key="duplicate" title="Duplicate" type="boolean"/>\n'
+                 '<Field key="addedAt" title="Date Added" type="date"/>\n'
+                 '<Field key="updatedAt" title="Date Updated" type="date"/>\n')
+
+
+############################################################
+# SYNTHETIC LIBRARY
+############################################################
+
+
+class FakeLibrary:
+    """
+    A Movies and a TV library holding items duplicate titles between them, the first half movies, the second half
+    episodes. Every item has copies media items of parts parts, each part with streams audio streams. With same_path
+    every copy of an item uses the same files, the dupes FIND_DUPLICATE_FILEPATHS_ONLY looks for.
+    """
+
+    def __init__(self, items=1000, copies=2, parts=1, streams=2, same_path=False):
+        self.items = items
+        self.copies = copies
+        self.parts = parts
+        self.streams = streams
+        self.same_path = same_path
+        self.movies = (items + 1) // 2
+        self.created = int(time.time()) - 86400
+        self.deleted = set()
+        self._generation = 0
+        self._dupes = {}
+        self._lock = threading.Lock()
+
+    def section_of(self, rating_key):
+        return 1 if rating_key <= self.movies else 2
+
+    def section_keys(self, section):
+        return range(1, self.movies + 1) if section == 1 else range(self.movies + 1, self.items + 1)
+
+    def media_ids(self, rating_key):
+        return [rating_key * 100 + copy for copy in range(1, self.copies + 1)
+                if rating_key * 100 + copy not in self.deleted]
+
+    def dupe_keys(self, section):
+        # recomputed only after deletions, a scan pages through the same list many times
+        with self._lock:
+            cached = self._dupes.get(section)
+            if cached is None or cached[0] != self._generation:
+                keys = [key for key in self.section_keys(section) if len(self.media_ids(key)) > 1]
+                cached = self._dupes[section] = (self._generation, keys)
+            return cached[1]
+
+    def delete(self, rating_key, media_id):
+        with self._lock:
+            if not 1 <= rating_key <= self.items or media_id not in self.media_ids(rating_key):
+                return False
+            self.deleted.add(media_id)
+            self._generation += 1
+            return True
+
+    def item_xml(self, rating_key, full=False):
+        if self.section_of(rating_key) == 1:
+            title = 'Movie %d' % rating_key
+            attrs = 'type="movie" title=%s year="%d"' % (quoteattr(title), 1950 + rating_key % 70)
+            folder = '/data/Movies/%s' % title
+            guid = 'plex://movie/%024x' % rating_key
+        else:
+            episode = rating_key - self.movies
+            show, season, index = episode // 100, episode // 10 % 10 + 1, episode % 10 + 1
+            title = 'Episode %d' % index
+            attrs = ('type="episode" title=%s grandparentTitle="Show %d" parentIndex="%d" index="%d"'
+                     % (quoteattr(title), show, season, index))
+            folder = '/data/TV/Show %d/Season %02d' % (show, season)
+            guid = 'plex://episode/%024x' % rating_key
+
+        lines = ['<Video ratingKey="%d" key="/library/metadata/%d" guid="%s" %s librarySectionID="%d" '
+                 'addedAt="%d" updatedAt="%d">' % (rating_key, rating_key, guid, attrs,
+                                                   self.section_of(rating_key), self.created, self.created)]
+        for media_id in self.media_ids(rating_key):
+            # seeded per media item, so it looks the same in every response and after other copies are deleted
+            rng = random.Random(media_id)
+            resolution, width, height, bitrate = rng.choice(RESOLUTIONS)
+            audio_codec, channels = rng.choice(AUDIO_CODECS)
+            container = rng.choice(CONTAINERS)
+            duration = rng.randint(20, 180) * 60000
+            lines.append('<Media id="%d" duration="%d" bitrate="%d" width="%d" height="%d" videoResolution="%s" '
+                         'videoCodec="%s" audioCodec="%s" audioChannels="%d" container="%s">'
+                         % (media_id, duration, bitrate + rng.randint(0, 2000), width, height, resolution,
+                            rng.choice(VIDEO_CODECS), audio_codec, channels, container))
+            release = rng.choice(RELEASES)
+            for part in range(1, self.parts + 1):
+                part_id = media_id * 10 + part
+                cd = '.cd%d' % part if self.parts > 1 else ''
+                filename = '%s/%s.%sp.%s%s.%s' % (folder, title.replace(' ', '.'), height, release, cd, container)
+                if self.same_path:
+                    filename = '%s/%s%s.mkv' % (folder, title.replace(' ', '.'), cd)
+                lines.append('<Part id="%d" key="/library/parts/%d/file.%s" file=%s size="%d" duration="%d" '
+                             'container="%s">' % (part_id, part_id, container, quoteattr(filename),
+                                                  rng.randint(500, 60000) * 1048576, duration // self.parts,
+                                                  container))
+                if full:
+                    lines.append('<Stream id="%d1" streamType="1" codec="h264" index="0"/>' % part_id)
+                    for stream in range(self.streams):
+                        lines.append('<Stream id="%d%d" streamType="2" codec="%s" channels="%d" index="%d" '
+                                     'title="Track %d"/>' % (part_id, stream + 2, audio_codec, channels, stream + 1,
+                                                              stream + 1))
+                lines.append('</Part>')
+            lines.append('</Media>')
+        lines.append('</Video>')
+        return ''.join(lines)
+
+
+############################################################
+# HTTP SERVER
+############################################################
+
+
+class FakePlexHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.record(self.command, self.path)
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        path = url.path.rstrip('/') or '/'
+        library = self.server.library
+
+        if path == '/':
+            return self.send_xml('<MediaContainer size="0" friendlyName="fake_plex" machineIdentifier="fake" '
+                                 'version="1.32.0.0" platform="Linux" myPlex="0" allowMediaDeletion="1"/>')
+        if path == '/library':
+            return self.send_xml('<MediaContainer size="1" title1="Plex Library">'
+                                 '<Directory key="sections" title="Library Sections"/></MediaContainer>')
+        if path == '/library/sections':
+            return self.send_xml('<MediaContainer size="2">'
+                                 '<Directory key="1" type="movie" title="Movies" agent="tv.plex.agents.movie" '
+                                 'uuid="fake-1" language="en-US"><Location id="1" path="/data/Movies"/></Directory>'
+                                 '<Directory key="2" type="show" title="TV" agent="tv.plex.agents.series" '
+                                 'uuid="fake-2" language="en-US"><Location id="2" path="/data/TV"/></Directory>'
+                                 '</MediaContainer>')
+
+        parts = path.split('/')
+        if path.startswith('/library/sections/') and len(parts) == 5 and parts[3] in ('1', '2'):
+            section = int(parts[3])
+            if params.get('includeMeta'):
+                return self.send_xml('<MediaContainer size="0">%s</MediaContainer>'
+                                     % FILTER_META.format(key=section, fields=FILTER_FIELDS))
+            if parts[4] != 'all':
+                return self.send_xml('<MediaContainer size="0"/>')
+            keys = library.dupe_keys(section) if params.get('duplicate') == '1' else library.section_keys(section)
+            since = [int(value) for name, value in params.items() if name in ('addedAt>>', 'updatedAt>>')]
+            if since and library.created <= min(since):
+                keys = []
+            start = int(params.get('X-Plex-Container-Start', 0))
+            size = int(params.get('X-Plex-Container-Size', 100))
+            page = keys[start:start + size]
+            return self.send_xml('<MediaContainer size="%d" totalSize="%d" offset="%d" librarySectionID="%d">%s'
+                                 '</MediaContainer>' % (len(page), len(keys), start, section,
+                                                        ''.join(library.item_xml(key) for key in page)))
+        if path.startswith('/library/metadata/') and len(parts) == 4:
+            try:
+                keys = [int(key) for key in parts[3].split(',')]
+            except ValueError:
+                return self.send_error(400)
+            keys = [key for key in keys if 1 <= key <= library.items]
+            if not keys:
+                return self.send_error(404)
+            return self.send_xml('<MediaContainer size="%d">%s</MediaContainer>'
+                                 % (len(keys), ''.join(library.item_xml(key, full=True) for key in keys)))
+        self.send_error(404)
+
+    def do_DELETE(self):
+        self.server.record(self.command, self.path)
+        parts = urlsplit(self.path).path.split('/')
+        # /library/metadata/<ratingKey>/media/<id>
+        if len(parts) == 6 and parts[1:3] == ['library', 'metadata'] and parts[4] == 'media':
+            try:
+                deleted = self.server.library.delete(int(parts[3]), int(parts[5]))
+            except ValueError:
+                deleted = False
+            if deleted:
+                self.server.record_delete()
+                return self.send_xml('')
+        self.send_error(404)
+
+    def send_xml(self, body):
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml;charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakePlexServer(ThreadingHTTPServer):
+    """
+    Serves a FakeLibrary, delaying every request by latency seconds and counting requests per endpoint.
+    """
+    daemon_threads = True
+
+    def __init__(self, library, address=('127.0.0.1', 0), latency=0.0):
+        super().__init__(address, FakePlexHandler)
+        self.library = library
+        self.latency = latency
+        self.requests = collections.Counter()
+        self.delete_times = []
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address[:2]
+
+    def record(self, method, path):
+        with self._lock:
+            self.requests[(method, normalize_endpoint(path))] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def record_delete(self):
+        with self._lock:
+            self.delete_times.append(time.perf_counter())
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a synthetic Plex library.")
+    parser.add_argument('--items', type=int, default=1000, help="duplicate titles (default: %(default)s)")
+    parser.add_argument('--copies', type=int, default=2, help="media items per title (default: %(default)s)")
+    parser.add_argument('--parts', type=int, default=1, help="parts per media item (default: %(default)s)")
+    parser.add_argument('--streams', type=int, default=2, help="audio streams per part (default: %(default)s)")
+    parser.add_argument('--same-path', action='store_true', help="give every copy of an item the same files")
+    parser.add_argument('--latency', type=float, default=0, help="milliseconds added to every request")
+    parser.add_argument('--port', type=int, default=32400)
+    args = parser.parse_args()
+
+    server = FakePlexServer(FakeLibrary(args.items, args.copies, args.parts, args.streams, args.same_path),
+                            ('127.0.0.1', args.port), args.latency / 1000.0)
+    print("Serving %d duplicate titles on %s (libraries: Movies, TV)" % (args.items, server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
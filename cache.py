@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger("Plex_Dupefinder")
+
+
+############################################################
+# MEDIA INFO CACHE
+############################################################
+
+
+class MediaInfoCache:
+    """
+    SQLite backed store of the info dicts built by get_media_info.
+
+    Entries are keyed by media id and only returned while the part files and the item's updatedAt still match what
+    Plex reports, so a changed item is always fetched again. Scores are stored with the hash of the scoring config
+    they were computed with and are dropped as soon as that hash changes.
+    """
+
+    def __init__(self, path, max_entries, score_hash):
+        self.path = path
+        self.max_entries = max_entries
+        self.score_hash = score_hash
+        self._lock = threading.Lock()
+        self._pending_writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS media_info ('
+                           'media_id INTEGER PRIMARY KEY, '
+                           'files TEXT NOT NULL, '
+                           'updated_at INTEGER NOT NULL, '
+                           'info TEXT NOT NULL, '
+                           'score INTEGER, '
+                           'score_hash TEXT, '
+                           'accessed REAL NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS media_info_accessed ON media_info (accessed)')
+        self._conn.commit()
+
+    def _lookup(self, media_id, files, updated_at):
+        row = self._conn.execute('SELECT files, updated_at, info, score, score_hash FROM media_info '
+                                 'WHERE media_id = ?', (media_id,)).fetchone()
+        if row is None or row[0] != json.dumps(files) or row[1] != updated_at:
+            return None
+        return row
+
+    def contains(self, media_id, files, updated_at):
+        with self._lock:
+            return self._lookup(media_id, files, updated_at) is not None
+
+    def get(self, media_id, files, updated_at):
+        """
+        Returns the cached info dict, with its 'score' when it was computed with the current scoring config,
+        or None when there is no valid entry.
+        """
+        with self._lock:
+            row = self._lookup(media_id, files, updated_at)
+            if row is None:
+                return None
+            self._conn.execute('UPDATE media_info SET accessed = ? WHERE media_id = ?', (time.time(), media_id))
+            self._written()
+
+        info = json.loads(row[2])
+        if row[3] is not None and row[4] == self.score_hash:
+            info['score'] = row[3]
+        return info
+
+    def put(self, media_id, files, updated_at, info):
+        stored_info = {k: v for k, v in info.items() if k not in ('score', 'show_key', 'server')}
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO media_info VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               (media_id, json.dumps(files), updated_at, json.dumps(stored_info), info.get('score'),
+                                self.score_hash if 'score' in info else None, time.time()))
+            self._written()
+
+    def put_score(self, media_id, score):
+        with self._lock:
+            self._conn.execute('UPDATE media_info SET score = ?, score_hash = ? WHERE media_id = ?',
+                               (score, self.score_hash, media_id))
+            self._written()
+
+    def _written(self):
+        self._pending_writes += 1
+        if self._pending_writes >= 500:
+            self._conn.commit()
+            self._pending_writes = 0
+
+    def evict(self):
+        with self._lock:
+            count = self._conn.execute('SELECT COUNT(*) FROM media_info').fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute('DELETE FROM media_info WHERE media_id IN ('
+                                   'SELECT media_id FROM media_info ORDER BY accessed ASC LIMIT ?)',
+                                   (count - self.max_entries,))
+                log.info("Evicted %d entries from media info cache %r", count - self.max_entries, self.path)
+            self._conn.commit()
+            self._pending_writes = 0
+
+    def close(self):
+        self.evict()
+        with self._lock:
+            self._conn.close()
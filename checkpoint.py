@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import json
+import logging
+import os
+import threading
+import time
+
+from media import MediaPart
+
+log = logging.getLogger("Plex_Dupefinder")
+
+
+############################################################
+# CHECKPOINT
+############################################################
+
+
+class Checkpoint:
+    """
+    Append-only JSON lines journal of scan and delete progress, so an interrupted run can be resumed.
+
+    Scanned items are flushed to disk every interval seconds, confirmed deletions and decisions immediately.
+    """
+
+    def __init__(self, path, resume=False, interval=30):
+        self.path = path
+        self.interval = interval
+        self.sections_done = set()
+        self.items_done = set()
+        self.titles = {}
+        self.decided = set()
+        self.deleted = set()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+        if resume and os.path.exists(path):
+            self._load()
+        self._fp = open(path, 'a' if resume else 'w')
+
+    def _load(self):
+        with open(self.path, 'r') as fp:
+            for line_number, line in enumerate(fp, start=1):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the last line may have been cut off when the previous run died
+                    log.warning("Ignoring unreadable line %d of checkpoint %r", line_number, self.path)
+                    continue
+                if 'title' in entry:
+                    self.items_done.add((entry['section'], entry['key']))
+                    self.titles[entry['title']] = {part_info['id']: MediaPart.from_dict(part_info)
+                                                   for part_info in entry['parts']}
+                elif 'section_done' in entry:
+                    self.sections_done.add(entry['section_done'])
+                elif 'decided' in entry:
+                    self.decided.add(entry['decided'])
+                elif 'deleted' in entry:
+                    self.deleted.add(entry['deleted'])
+        log.info("Loaded checkpoint %r: %d section(s), %d title(s), %d decision(s), %d deletion(s)", self.path,
+                 len(self.sections_done), len(self.titles), len(self.decided), len(self.deleted))
+
+    def _write(self, entry, flush=False):
+        with self._lock:
+            self._fp.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            if flush or time.monotonic() - self._last_flush >= self.interval:
+                self._fp.flush()
+                os.fsync(self._fp.fileno())
+                self._last_flush = time.monotonic()
+
+    def record_item(self, section, key, title, parts):
+        self._write({'section': section, 'key': key, 'title': title,
+                     'parts': [part_info.to_dict() for part_info in parts.values()]})
+
+    def record_section(self, section):
+        self.sections_done.add(section)
+        self._write({'section_done': section}, flush=True)
+
+    def record_decided(self, title):
+        self.decided.add(title)
+        self._write({'decided': title}, flush=True)
+
+    def record_deleted(self, media_id):
+        self.deleted.add(media_id)
+        self._write({'deleted': media_id}, flush=True)
+
+    def close(self, remove=False):
+        with self._lock:
+            self._fp.close()
+        if remove:
+            os.remove(self.path)
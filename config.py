@@ -5,7 +5,6 @@ import json
 import os
 import sys
 
-from plexapi.myplex import MyPlexAccount
 from getpass import getpass
 
 config_path = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), 'config.json')
@@ -13,6 +12,7 @@ base_config = {
     'PLEX_SERVER': 'https://plex.your-server.com',
     'PLEX_TOKEN': '',
     'PLEX_LIBRARIES': {},
+    'PLEX_SERVERS': [],
     'AUDIO_CODEC_SCORES': {'Unknown': 0, 'wmapro': 200, 'mp2': 500, 'mp3': 1000, 'ac3': 1000, 'dca': 2000, 'pcm': 2500,
                            'flac': 2500, 'dca-ma': 4000, 'truehd': 4500, 'aac': 1000, 'eac3': 1250},
     'VIDEO_CODEC_SCORES': {'Unknown': 0, 'h264': 10000, 'h265': 5000, 'hevc': 5000, 'mpeg4': 500, 'vc1': 3000,
@@ -22,9 +22,33 @@ base_config = {
     'FILENAME_SCORES': {},
     'SKIP_LIST': [],
     'SCORE_FILESIZE': True,
+    'SEARCH_PAGE_SIZE': 100,
+    'SECTION_WORKERS': 2,
     'AUTO_DELETE': False,
-    'FIND_DUPLICATE_FILEPATHS_ONLY': False
+    'CACHE_ENABLED': True,
+    'CACHE_MAX_ENTRIES': 250000,
+    'CHECKPOINT_INTERVAL': 30,
+    'CROSS_SERVER_REPORT': False,
+    'DECISIONS_JSON': False,
+    'DELETE_RATE_LIMIT': 2,
+    'DELETE_RETRIES': 3,
+    'DELETE_WORKERS': 4,
+    'DELETE_FILES': False,
+    'DELETE_FILES_DRY_RUN': False,
+    'DELETE_FILES_WORKERS': 8,
+    'FIND_DUPLICATE_FILEPATHS_ONLY': False,
+    'FINGERPRINT_DUPES': False,
+    'FINGERPRINT_WORKERS': 4,
+    'INCREMENTAL_SCAN': False,
+    'LOG_LEVEL': 'DEBUG',
+    'METADATA_BATCH_SIZE': 50,
+    'METADATA_WORKERS': 4,
+    'METRICS_FILE': '',
+    'PATH_MAPPINGS': {},
+    'WATCH_DEBOUNCE': 30,
+    'WATCH_QUEUE_SIZE': 10
 }
+# loaded by get_config() on first use, so importing this module (or running --help) needs no config.json
 cfg = None
 
 
@@ -92,6 +116,8 @@ def build_config():
         elif auto_del.strip().lower() == 'n':
             configs['auto_delete'] = False
 
+    # plexapi is slow to import, only the first run signs in to plex.tv
+    from plexapi.myplex import MyPlexAccount
     account = MyPlexAccount(user, password)
     configs['token'] = account.authenticationToken
 
@@ -149,18 +175,40 @@ def upgrade_settings(defaults, currents):
     return upgraded, upgraded_settings
 
 
+def server_configs(config):
+    """
+    Returns the servers to scan as dicts with a NAME, URL, TOKEN, LIBRARIES and PATH_MAPPINGS.
+
+    PLEX_SERVERS takes precedence, otherwise the single PLEX_SERVER / PLEX_TOKEN / PLEX_LIBRARIES server is used,
+    with an empty name. Servers listed without a NAME are named server1, server2... and servers listed without
+    PATH_MAPPINGS use the top level PATH_MAPPINGS.
+    """
+    if config['PLEX_SERVERS']:
+        return [{'NAME': server.get('NAME') or 'server%d' % pos, 'URL': server['URL'], 'TOKEN': server['TOKEN'],
+                 'LIBRARIES': server['LIBRARIES'],
+                 'PATH_MAPPINGS': server.get('PATH_MAPPINGS', config['PATH_MAPPINGS'])}
+                for pos, server in enumerate(config['PLEX_SERVERS'], start=1)]
+    return [{'NAME': '', 'URL': config['PLEX_SERVER'], 'TOKEN': config['PLEX_TOKEN'],
+             'LIBRARIES': config['PLEX_LIBRARIES'], 'PATH_MAPPINGS': config['PATH_MAPPINGS']}]
+
+
 ############################################################
 # LOAD CFG
 ############################################################
 
-# dump/load config
-if build_config():
-    print("Please edit the default configuration before running again!")
-    sys.exit(0)
-else:
-    tmp = load_config()
-    upgraded, cfg = upgrade_settings(base_config, tmp)
+
+def get_config():
+    global cfg
+    if cfg is not None:
+        return cfg
+
+    # dump/load config
+    if build_config():
+        print("Please edit the default configuration before running again!")
+        sys.exit(0)
+    upgraded, cfg = upgrade_settings(base_config, load_config())
     if upgraded:
         dump_config()
         print("New config options were added, adjust and restart!")
         sys.exit(0)
+    return cfg
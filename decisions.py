@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import atexit
+import json
+import threading
+import time
+
+
+############################################################
+# DECISIONS SINK
+############################################################
+
+
+class DecisionWriter:
+    """
+    Appends decisions to decisions.log through one buffered handle, flushed every flush_every decisions and on close.
+
+    When json_filename is set, every decision is also written as a JSON line holding the title, the kept media item
+    and the removed media items.
+    """
+
+    def __init__(self, filename, json_filename=None, flush_every=50):
+        self.flush_every = flush_every
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._fp = open(filename, 'a', buffering=1024 * 1024)
+        self._json_fp = open(json_filename, 'a', buffering=1024 * 1024) if json_filename else None
+        atexit.register(self.close)
+
+    def write(self, title, keeping=None, removed=()):
+        lines = ['\nTitle    : %s\n' % title]
+        if keeping:
+            lines.append('\tKeeping  : %r\n' % keeping)
+        for part_info in removed:
+            lines.append('\tRemoving : %r\n' % part_info)
+
+        with self._lock:
+            self._fp.writelines(lines)
+            if self._json_fp is not None:
+                self._json_fp.write(json.dumps({'time': int(time.time()), 'title': title,
+                                                'keeping': keeping.to_dict() if keeping else None,
+                                                'removed': [part_info.to_dict() for part_info in removed]},
+                                               separators=(',', ':')) + '\n')
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._flush()
+
+    def _flush(self):
+        self._fp.flush()
+        if self._json_fp is not None:
+            self._json_fp.flush()
+        self._pending = 0
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._fp.closed:
+                return
+            self._flush()
+            self._fp.close()
+            if self._json_fp is not None:
+                self._json_fp.close()
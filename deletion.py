@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from urlparse import urljoin
+except ImportError:
+    from urllib.parse import urljoin
+
+from fingerprint import map_path
+from metrics import Metrics
+
+log = logging.getLogger("Plex_Dupefinder")
+
+
+############################################################
+# RATE LIMITING
+############################################################
+
+
+class TokenBucket:
+    """
+    Allows rate calls per second on average, with bursts of up to capacity calls. A rate of 0 disables limiting.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+############################################################
+# DELETION EXECUTOR
+############################################################
+
+
+class DeletionExecutor:
+    """
+    Sends media DELETE requests to Plex from a pool of workers sharing one pooled session.
+
+    Requests are rate limited with a token bucket and retried with exponential backoff on 5xx responses, connection
+    errors and timeouts. submit() returns a future resolving to True once Plex confirmed the deletion. It blocks while
+    queue_size deletions (twice the workers by default) are waiting, so an interrupted run can cancel() the rest.
+    """
+
+    def __init__(self, session, server, token, workers=4, rate=2, retries=3, backoff=1.0, timeout=30, metrics=None,
+                 queue_size=None):
+        self.session = session
+        self.server = server
+        self.token = token
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        # requests comes in with the server sessions, file removal below does not need it
+        import requests
+        self._retry_errors = (requests.ConnectionError, requests.Timeout)
+        self.bucket = TokenBucket(rate)
+        self.metrics = metrics or Metrics()
+        self.deleted = []
+        self.failed = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(queue_size or workers * 2)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, show_key, media_id):
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self.delete, show_key, media_id)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def delete(self, show_key, media_id):
+        with self.metrics.phase('delete'):
+            return self._delete(show_key, media_id)
+
+    def _delete(self, show_key, media_id):
+        delete_url = urljoin(self.server, '%s/media/%d' % (show_key, media_id))
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            self.bucket.acquire()
+            log.debug("Sending DELETE request to %r", delete_url)
+            try:
+                response = self.session.delete(delete_url, headers={'X-Plex-Token': self.token},
+                                               timeout=self.timeout)
+            except self._retry_errors:
+                log.warning("Attempt %d of DELETE request to %r failed", attempt + 1, delete_url, exc_info=True)
+                continue
+            # a retry finding the media gone means an earlier attempt went through after all
+            if response.status_code == 200 or (response.status_code == 404 and attempt):
+                if response.status_code == 404:
+                    log.info("DELETE request to %r found the media item already deleted by an earlier attempt",
+                             delete_url)
+                with self._lock:
+                    self.deleted.append(media_id)
+                return True
+            if response.status_code < 500:
+                log.error("DELETE request to %r was refused with status %d", delete_url, response.status_code)
+                break
+            log.warning("Attempt %d of DELETE request to %r failed with status %d", attempt + 1, delete_url,
+                        response.status_code)
+
+        with self._lock:
+            self.failed.append(media_id)
+        return False
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def cancel(self):
+        """ Drops the deletions not sent yet and waits for those being sent, their futures end up cancelled. """
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def summary(self):
+        lines = ["Deleted %d media item(s), %d failed" % (len(self.deleted), len(self.failed))]
+        if self.failed:
+            lines.append("Failed to delete media item(s): %s" % ', '.join(str(media_id) for media_id in self.failed))
+        return '\n'.join(lines)
+
+
+############################################################
+# FILE REMOVAL
+############################################################
+
+
+class FileRemover:
+    """
+    Removes the files of removed media items from disk, from a pool of workers, translating the paths Plex reports
+    with the path mappings of their server.
+
+    With dry_run nothing is removed: the files are only logged and their sizes totalled, as Plex reported them when
+    every file of a media item would go, as found on disk otherwise.
+    """
+
+    def __init__(self, workers=8, dry_run=False):
+        self.dry_run = dry_run
+        self.removed = 0
+        self.missing = 0
+        self.shared = 0
+        self.reclaimed = 0
+        self.failed = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, part_info, path_mappings=None, keep_paths=()):
+        """
+        Removes the files of part_info, except those among keep_paths, the local paths of the media item kept in its
+        place: with FIND_DUPLICATE_FILEPATHS_ONLY the removed media items are the same files.
+        """
+        keep_paths = {os.path.realpath(path) for path in keep_paths}
+        paths = []
+        for path in (map_path(path, path_mappings or {}) for path in part_info.file):
+            if os.path.realpath(path) in keep_paths:
+                log.info("Not removing %r of media item %r, the kept media item uses it too", path, part_info.id)
+                with self._lock:
+                    self.shared += 1
+            else:
+                paths.append(path)
+        if self.dry_run:
+            for path in paths:
+                log.info("Dry run, not removing %r", path)
+            reclaimed = part_info.file_size if len(paths) == len(part_info.file) else \
+                sum(self._size(path, part_info) for path in paths)
+            with self._lock:
+                self.removed += len(paths)
+                self.reclaimed += reclaimed
+            return
+        for path in paths:
+            self._executor.submit(self._remove, path)
+
+    @staticmethod
+    def _size(path, part_info):
+        # a file not found here is taken to be an even share of the media item's size
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return part_info.file_size // max(len(part_info.file), 1)
+
+    def _remove(self, path):
+        try:
+            size = os.stat(path).st_size
+            os.unlink(path)
+        except FileNotFoundError:
+            log.info("File %r was already removed", path)
+            with self._lock:
+                self.missing += 1
+        except OSError:
+            log.exception("Exception removing file %r", path)
+            with self._lock:
+                self.failed.append(path)
+        else:
+            log.debug("Removed file %r", path)
+            with self._lock:
+                self.removed += 1
+                self.reclaimed += size
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def summary(self):
+        reclaimed = self.reclaimed / 1073741824.0
+        if self.dry_run:
+            return ("Dry run, would have removed %d file(s), reclaiming %.2f GB, %d kept as the kept media items use "
+                    "them" % (self.removed, reclaimed, self.shared))
+        lines = ["Removed %d file(s), reclaiming %.2f GB, %d were already gone, %d kept as the kept media items use "
+                 "them, %d failed" % (self.removed, reclaimed, self.missing, self.shared, len(self.failed))]
+        if self.failed:
+            lines.append("Failed to remove file(s): %s" % ', '.join(map(repr, self.failed)))
+        return '\n'.join(lines)
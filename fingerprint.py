@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+import collections
+import hashlib
+import logging
+import mmap
+import os
+import threading
+
+log = logging.getLogger("Plex_Dupefinder")
+
+# bytes hashed from the start and from the end of a file, enough to tell apart files of the same size
+BLOCK_SIZE = 1024 * 1024
+
+
+def map_path(path, mappings):
+    """ Translates a file path as Plex reports it to the local one, by the longest matching prefix of mappings. """
+    for prefix in sorted(mappings, key=len, reverse=True):
+        if path.startswith(prefix):
+            return mappings[prefix] + path[len(prefix):]
+    return path
+
+
+def partial_hash(path, block_size=BLOCK_SIZE):
+    """
+    SHA-1 of the size and the first and last block_size bytes of a file. The file is mapped instead of read, so only
+    the pages of those two blocks are ever fetched, however large the file is.
+    """
+    with open(path, 'rb') as fp:
+        size = os.fstat(fp.fileno()).st_size
+        digest = hashlib.sha1(str(size).encode('ascii'))
+        if size:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                digest.update(view[:block_size])
+                if size > block_size:
+                    digest.update(view[max(block_size, size - block_size):])
+    return digest.hexdigest()
+
+
+############################################################
+# FINGERPRINT INDEX
+############################################################
+
+
+class FingerprintIndex:
+    """
+    Groups media items by their content, to find copies Plex did not match as one title.
+
+    Media items are first grouped by the sizes of their parts, as reported by Plex, in one pass without touching
+    the disk. Plex's API does not expose a content hash of its own, so only the files of media items that share
+    their sizes with another are then hashed (see partial_hash), and the media items whose hashes match too are
+    returned as groups.
+    """
+
+    def __init__(self, path_mappings=None, block_size=BLOCK_SIZE):
+        self.path_mappings = path_mappings or {}
+        self.block_size = block_size
+        self.media_items = 0
+        self.files_read = 0
+        self.bytes_read = 0
+        self._by_size = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, key, files, sizes):
+        """ Adds a media item, key being anything that identifies it, with the files and sizes of its parts. """
+        # without a size for every part there is nothing cheap to compare on
+        if not files or not all(sizes):
+            return
+        self.media_items += 1
+        self._by_size[tuple(sizes)].append((key, tuple(files)))
+
+    def _hash(self, path):
+        local_path = map_path(path, self.path_mappings)
+        try:
+            digest = partial_hash(local_path, self.block_size)
+        except (OSError, ValueError) as ex:
+            log.warning("Unable to fingerprint %r (%r): %s", path, local_path, ex)
+            return None
+        with self._lock:
+            self.files_read += 1
+            self.bytes_read += min(os.path.getsize(local_path), 2 * self.block_size)
+        return digest
+
+    def groups(self, executor):
+        """
+        Returns the keys of media items with the same content, as lists in the order they were added. The files are
+        hashed on executor, so no more of them are read at once than it has workers.
+        """
+        candidates = [entries for entries in self._by_size.values() if len(entries) > 1]
+        paths = list(dict.fromkeys(path for entries in candidates for _, files in entries for path in files))
+        hashes = dict(zip(paths, executor.map(self._hash, paths)))
+
+        groups = []
+        for entries in candidates:
+            by_content = collections.defaultdict(list)
+            for key, files in entries:
+                content = tuple(hashes[path] for path in files)
+                if None not in content:
+                    by_content[content].append(key)
+            groups.extend(keys for keys in by_content.values() if len(keys) > 1)
+        return groups
+
+    @property
+    def sharing_size(self):
+        return sum(len(entries) for entries in self._by_size.values() if len(entries) > 1)
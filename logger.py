@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '[%(asctime)s] %(levelname)s - %(message)s'
+LOG_DATE_FORMAT = '%H:%M:%S'
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        # this is the only handler, so the record can be handed over as is instead of being formatted and copied
+        if record.exc_info:
+            return super().prepare(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(filename, level='DEBUG'):
+    """
+    Logs to filename from a background thread.
+
+    The logging thread only merges the message arguments and puts the record on a queue. Formatting the line and
+    writing it happens in a QueueListener, so the scan never blocks on disk. This costs a little more than writing
+    the line right away (see benchmarks/bench_logging.py), it only pays off when the disk is slow. The listener is
+    stopped (and the queue drained) at exit.
+    """
+    file_handler = logging.FileHandler(filename)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+
+    log_queue = queue.Queue(-1)
+    listener = QueueListener(log_queue, file_handler)
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, str(level).upper(), logging.DEBUG))
+    root.addHandler(_QueueHandler(log_queue))
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+import re
+from collections import deque
+from fnmatch import translate
+
+
+############################################################
+# MULTI PATTERN MATCHING
+############################################################
+
+
+class AhoCorasick:
+    """
+    Finds every keyword that occurs in a string with a single pass over that string (Aho-Corasick automaton).
+
+    Matching cost only depends on the length of the text and the number of hits, not on the number of keywords.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+
+        for keyword in keywords:
+            self.add(keyword)
+        self._build()
+
+    def add(self, keyword):
+        if not keyword:
+            raise ValueError("Empty keywords can not be matched")
+        node = 0
+        for char in keyword:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        self._out[node] += (len(self.keywords),)
+        self.keywords.append(keyword)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def search(self, text):
+        """ Returns the set of keyword indexes found in text. """
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+    def contains_any(self, text):
+        """ Returns True as soon as any keyword is found in text. """
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                return True
+        return False
+
+
+class SubstringSet:
+    """
+    Tells whether a string contains any of many substrings, with a single Aho-Corasick pass over that string. An empty
+    substring is contained in every string.
+    """
+
+    def __init__(self, substrings):
+        substrings = set(substrings)
+        self.matches_all = '' in substrings
+        self._index = AhoCorasick(substring for substring in substrings if substring)
+
+    def __contains__(self, text):
+        return self.matches_all or self._index.contains_any(text)
+
+
+############################################################
+# GLOB MATCHING
+############################################################
+
+_glob_wildcards = re.compile(r'\*|\?|\[!?\]?[^\]]*\]')
+
+
+class GlobSet:
+    """
+    Matches a string against many fnmatch style globs at once.
+
+    Every glob is indexed by the longest literal run it contains. A single Aho-Corasick pass over the string tells us
+    which literals are present, and only the globs owning one of those literals are verified with their compiled regex.
+    Globs without any literal (e.g. '*') are always verified.
+    """
+
+    def __init__(self, globs):
+        self.globs = list(globs)
+        self._regexes = [re.compile(translate(glob)) for glob in self.globs]
+        self._always = []
+
+        literals = {}
+        owners = []
+        for pos, glob in enumerate(self.globs):
+            literal = max(_glob_wildcards.split(glob), key=len)
+            if not literal:
+                self._always.append(pos)
+                continue
+            if literal not in literals:
+                literals[literal] = len(owners)
+                owners.append([])
+            owners[literals[literal]].append(pos)
+
+        self._owners = owners
+        self._index = AhoCorasick(literals) if literals else None
+
+    def match(self, text):
+        """ Returns the sorted indexes of the globs matching text. """
+        candidates = list(self._always)
+        if self._index is not None:
+            for literal in self._index.search(text):
+                candidates.extend(self._owners[literal])
+        return sorted(pos for pos in candidates if self._regexes[pos].match(text))
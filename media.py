@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import sys
+
+# in the order they have always been written to decisions.log
+MEDIA_FIELDS = ('id', 'video_bitrate', 'audio_codec', 'audio_channels', 'video_codec', 'video_resolution',
+                'video_width', 'video_height', 'video_duration', 'file', 'multipart', 'file_size')
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+############################################################
+# MEDIA PART
+############################################################
+
+
+class MediaPart:
+    """
+    A media item (copy) of a title, with the score and the show_key (and server) it is deleted through.
+
+    Every scanned part is held until the run ends, so this is slotted, with interned codec and resolution names and
+    the files kept as a tuple. to_dict() and repr() give the dict it replaced, so decisions.log, plan files,
+    checkpoints and the cache keep their format.
+    """
+
+    __slots__ = MEDIA_FIELDS + ('score', 'show_key', 'server')
+
+    def __init__(self, id='Unknown', video_bitrate=0, audio_codec='Unknown', audio_channels=0, video_codec='Unknown',
+                 video_resolution='Unknown', video_width=0, video_height=0, video_duration=0, file=(),
+                 multipart=False, file_size=0, score=None, show_key=None, server=None):
+        self.id = id
+        self.video_bitrate = video_bitrate
+        self.audio_codec = _intern(audio_codec)
+        self.audio_channels = audio_channels
+        self.video_codec = _intern(video_codec)
+        self.video_resolution = _intern(video_resolution)
+        self.video_width = video_width
+        self.video_height = video_height
+        self.video_duration = video_duration
+        self.file = tuple(file)
+        self.multipart = multipart
+        self.file_size = file_size
+        self.score = score
+        self.show_key = show_key
+        self.server = _intern(server) if server else None
+
+    @classmethod
+    def from_dict(cls, info):
+        return cls(**info)
+
+    def to_dict(self):
+        info = {field: getattr(self, field) for field in MEDIA_FIELDS}
+        info['file'] = list(self.file)
+        if self.score is not None:
+            info['score'] = self.score
+        if self.show_key is not None:
+            info['show_key'] = self.show_key
+        if self.server:
+            info['server'] = self.server
+        return info
+
+    def __repr__(self):
+        return repr(self.to_dict())
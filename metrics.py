@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+_endpoint_ids = re.compile(r'/\d+(?:,\d+)*(?=/|$)')
+
+
+def percentile(values, pct):
+    """ Nearest-rank percentile of an already sorted list. """
+    if not values:
+        return 0.0
+    rank = max(int(round(pct / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def normalize_endpoint(path):
+    """ Collapses ids (and comma separated id lists) in a Plex path, e.g. /library/metadata/{id}/media/{id}. """
+    return _endpoint_ids.sub('/{id}', path.split('?', 1)[0])
+
+
+############################################################
+# METRICS
+############################################################
+
+
+class Metrics:
+    """
+    Collects time spent per phase of a run and count, bytes and latency of every HTTP request made to Plex.
+
+    Phases may be timed from several threads at once, their time is the sum over all threads.
+    """
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self):
+        self.started = time.time()
+        self.phases = {}
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                calls, seconds = self.phases.get(name, (0, 0.0))
+                self.phases[name] = (calls + 1, seconds + elapsed)
+
+    def record_response(self, response, *args, **kwargs):
+        """ requests response hook, see Session.hooks. """
+        key = (response.request.method, normalize_endpoint(response.request.path_url))
+        size = len(response.content or b'')
+        latency = response.elapsed.total_seconds()
+        with self._lock:
+            endpoint = self.endpoints.setdefault(key, {'requests': 0, 'bytes': 0, 'latencies': []})
+            endpoint['requests'] += 1
+            endpoint['bytes'] += size
+            endpoint['latencies'].append(latency)
+
+    @property
+    def requests(self):
+        with self._lock:
+            return sum(endpoint['requests'] for endpoint in self.endpoints.values())
+
+    def endpoint_requests(self, method, endpoint):
+        """ Requests made so far to one endpoint, as normalized by normalize_endpoint. """
+        with self._lock:
+            return self.endpoints.get((method, endpoint), {'requests': 0})['requests']
+
+    def as_dict(self):
+        with self._lock:
+            result = {
+                'duration_seconds': round(time.time() - self.started, 3),
+                'phases': {name: {'calls': calls, 'seconds': round(seconds, 6)}
+                           for name, (calls, seconds) in self.phases.items()},
+                'endpoints': [],
+            }
+            for (method, path), endpoint in sorted(self.endpoints.items()):
+                latencies = sorted(endpoint['latencies'])
+                entry = {'method': method, 'endpoint': path, 'requests': endpoint['requests'],
+                         'bytes': endpoint['bytes']}
+                for pct in self.PERCENTILES:
+                    entry['latency_p%d_seconds' % pct] = round(percentile(latencies, pct), 6)
+                result['endpoints'].append(entry)
+        return result
+
+    def as_prometheus(self):
+        data = self.as_dict()
+        lines = [
+            '# HELP plex_dupefinder_run_duration_seconds Wall time of the run.',
+            '# TYPE plex_dupefinder_run_duration_seconds gauge',
+            'plex_dupefinder_run_duration_seconds %s' % data['duration_seconds'],
+            '# HELP plex_dupefinder_phase_seconds Time spent per phase, summed over threads.',
+            '# TYPE plex_dupefinder_phase_seconds gauge',
+        ]
+        for name, phase in data['phases'].items():
+            lines.append('plex_dupefinder_phase_seconds{phase="%s"} %s' % (name, phase['seconds']))
+        lines += ['# HELP plex_dupefinder_phase_calls Number of times a phase was entered.',
+                  '# TYPE plex_dupefinder_phase_calls gauge']
+        for name, phase in data['phases'].items():
+            lines.append('plex_dupefinder_phase_calls{phase="%s"} %d' % (name, phase['calls']))
+
+        lines += ['# HELP plex_dupefinder_http_requests Requests made to Plex per endpoint.',
+                  '# TYPE plex_dupefinder_http_requests gauge']
+        for entry in data['endpoints']:
+            lines.append('plex_dupefinder_http_requests{method="%s",endpoint="%s"} %d'
+                         % (entry['method'], entry['endpoint'], entry['requests']))
+        lines += ['# HELP plex_dupefinder_http_response_bytes Response bytes received from Plex per endpoint.',
+                  '# TYPE plex_dupefinder_http_response_bytes gauge']
+        for entry in data['endpoints']:
+            lines.append('plex_dupefinder_http_response_bytes{method="%s",endpoint="%s"} %d'
+                         % (entry['method'], entry['endpoint'], entry['bytes']))
+        lines += ['# HELP plex_dupefinder_http_latency_seconds Latency percentiles of Plex requests per endpoint.',
+                  '# TYPE plex_dupefinder_http_latency_seconds gauge']
+        for entry in data['endpoints']:
+            for pct in self.PERCENTILES:
+                lines.append('plex_dupefinder_http_latency_seconds{method="%s",endpoint="%s",quantile="%s"} %s'
+                             % (entry['method'], entry['endpoint'], pct / 100.0,
+                                entry['latency_p%d_seconds' % pct]))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """ Writes a Prometheus textfile when path ends with .prom, JSON otherwise. """
+        if path.endswith('.prom'):
+            content = self.as_prometheus()
+        else:
+            content = json.dumps(self.as_dict(), indent=2) + '\n'
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            fp.write(content)
+        os.replace(tmp_path, path)
@@ -1,47 +1,108 @@
 #!/usr/bin/env python3
+import argparse
+import ast
 import collections
+import contextlib
+import csv
+import functools
 import itertools
+import json
 import logging
 import os
+import queue
+import re
+import signal
 import sys
 import time
-from fnmatch import fnmatch
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from datetime import datetime
 
-from tabulate import tabulate
-
-from config import cfg
-
-try:
-    from urlparse import urljoin
-except ImportError:
-    from urllib.parse import urljoin
-
-from plexapi.server import PlexServer
-import requests
+from checkpoint import Checkpoint
+from config import get_config, server_configs
+from decisions import DecisionWriter
+from fingerprint import FingerprintIndex, map_path
+from logger import setup_logging
+from matching import SubstringSet
+from media import MediaPart
+from metrics import Metrics
+from scoring import SCORING_KEYS, MediaScorer, grouped_argmax, scoring_config_hash
+from watcher import SectionDebouncer, library_changes
 
 ############################################################
 # INIT
 ############################################################
 
-# Setup logger
+# The config, logging, scorer and decision writer are set up by init() once the arguments are parsed, so --help
+# neither needs a config.json nor pays for them; plexapi, requests and tabulate are imported where they are used
+cfg = None
+scorer = None
+file_remover = None
+skip_matcher = None
 log_filename = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), 'activity.log')
-logging.basicConfig(
-    filename=log_filename,
-    level=logging.DEBUG,
-    format='[%(asctime)s] %(levelname)s - %(message)s',
-    datefmt='%H:%M:%S'
-)
-logging.getLogger('urllib3.connectionpool').disabled = True
 log = logging.getLogger("Plex_Dupefinder")
 
-# Setup PlexServer object
-try:
-    plex = PlexServer(cfg['PLEX_SERVER'], cfg['PLEX_TOKEN'])
-except:
-    log.exception("Exception connecting to server %r with token %r", cfg['PLEX_SERVER'], cfg['PLEX_TOKEN'])
-    print(f"Exception connecting to {cfg['PLEX_SERVER']} with token: {cfg['PLEX_TOKEN']}")
+# Setup instrumentation, timing the phases of a run and every request made through the server sessions
+metrics = Metrics()
+
+# the commands removing media, only they write decisions.log (and remove files)
+DECIDING_COMMANDS = ('run', 'apply', 'apply-review', 'watch')
+
+
+def init(command):
+    global cfg, scorer, decision_writer, file_remover, skip_matcher
+    cfg = get_config()
+
+    # Setup logger
+    setup_logging(log_filename, cfg['LOG_LEVEL'])
+    logging.getLogger('urllib3.connectionpool').disabled = True
+
+    # Setup scorer
+    scorer = MediaScorer(cfg)
+
+    # Setup SKIP_LIST matching, every entry is looked for in a path with a single pass over it
+    skip_matcher = SubstringSet(cfg['SKIP_LIST'])
+
+    if command not in DECIDING_COMMANDS:
+        return
+
+    decision_writer = DecisionWriter(decision_filename, decision_json_filename if cfg['DECISIONS_JSON'] else None)
+
+    # Setup removal of the files of removed media items
+    if cfg['DELETE_FILES']:
+        from deletion import FileRemover
+        file_remover = FileRemover(cfg['DELETE_FILES_WORKERS'], cfg['DELETE_FILES_DRY_RUN'])
+
+
+def get_cache_filename(server_name):
+    # the single server setup keeps using cache.db, every named server gets a cache of its own
+    if not server_name:
+        return os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), 'cache.db')
+    return os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])),
+                        'cache-%s.db' % re.sub(r'[^\w.-]', '_', server_name))
 
-    exit(1)
+
+# The servers to scan, each with its own session, deletion executor and media info cache, see connect_servers
+servers = []
+servers_by_name = {}
+
+
+def connect_servers():
+    # plexapi and requests come in with servers, only the commands that talk to Plex pay for importing them
+    from servers import Server
+
+    for server_config in server_configs(cfg):
+        try:
+            servers.append(Server(server_config['NAME'], server_config['URL'], server_config['TOKEN'],
+                                  server_config['LIBRARIES'], cfg, metrics,
+                                  get_cache_filename(server_config['NAME']) if cfg['CACHE_ENABLED'] else None,
+                                  scoring_config_hash(cfg), server_config['PATH_MAPPINGS']))
+        except:
+            log.exception("Exception connecting to server %r with token %r", server_config['URL'],
+                          server_config['TOKEN'])
+            print(f"Exception connecting to {server_config['URL']} with token: {server_config['TOKEN']}")
+
+            exit(1)
+        servers_by_name[servers[-1].name] = servers[-1]
 
 
 ############################################################
@@ -49,76 +110,96 @@ except:
 ############################################################
 
 
-def get_dupes(plex_section_name):
-    sec_type = get_section_type(plex_section_name)
-    dupe_search_results = plex.library.section(plex_section_name).search(duplicate=True, libtype=sec_type)
+def search_pages(section, **kwargs):
+    # page through the search so items are handed on as soon as they arrive, never holding the whole section
+    page_size = cfg['SEARCH_PAGE_SIZE']
+    container_start = 0
+    while True:
+        with metrics.phase('search'):
+            page = section.search(container_start=container_start, container_size=page_size, maxresults=page_size,
+                                  **kwargs)
+        yield from page
+        if len(page) < page_size:
+            return
+        container_start += page_size
 
-    dupe_search_results_new = dupe_search_results.copy()
-    if cfg['FIND_DUPLICATE_FILEPATHS_ONLY']:
-        for dupe in dupe_search_results:
-            if any(x != dupe.locations[0] for x in dupe.locations):
-                dupe_search_results_new.remove(dupe)
-    return dupe_search_results_new
+
+def get_dupes(server, plex_section_name, since=None):
+    sec_type = get_section_type(server, plex_section_name)
+    section = server.section(plex_section_name)
+    filters = None
+    if since is not None:
+        since = datetime.fromtimestamp(since)
+        filters = {'or': [{'addedAt>>': since}, {'updatedAt>>': since}]}
+    for dupe in search_pages(section, duplicate=True, libtype=sec_type, filters=filters):
+        if cfg['FIND_DUPLICATE_FILEPATHS_ONLY'] and any(x != dupe.locations[0] for x in dupe.locations):
+            continue
+        yield dupe
 
 
-def get_section_type(plex_section_name):
+def has_dupes(item):
+    # an item of full metadata the duplicate search (see get_dupes) would have returned
+    if len(item.media) < 2:
+        return False
+    return not cfg['FIND_DUPLICATE_FILEPATHS_ONLY'] or all(x == item.locations[0] for x in item.locations)
+
+
+def get_section_type(server, plex_section_name):
     try:
-        plex_section_type = plex.library.section(plex_section_name).type
+        plex_section_type = server.section(plex_section_name).type
     except Exception:
-        log.exception("Exception occurred while trying to lookup the section type for Library: %s", plex_section_name)
+        log.exception("Exception occurred while trying to lookup the section type for Library: %s",
+                      server.label(plex_section_name))
         exit(1)
     return 'episode' if plex_section_type == 'show' else 'movie'
 
 
-def get_score(media_info):
-    score = 0
-    # score audio codec
-    for codec, codec_score in cfg['AUDIO_CODEC_SCORES'].items():
-        if codec.lower() == media_info['audio_codec'].lower():
-            score += int(codec_score)
-            log.debug("Added %d to score for audio_codec being %r", int(codec_score), str(codec))
-            break
-    # score video codec
-    for codec, codec_score in cfg['VIDEO_CODEC_SCORES'].items():
-        if codec.lower() == media_info['video_codec'].lower():
-            score += int(codec_score)
-            log.debug("Added %d to score for video_codec being %r", int(codec_score), str(codec))
-            break
-    # score video resolution
-    for resolution, resolution_score in cfg['VIDEO_RESOLUTION_SCORES'].items():
-        if resolution.lower() == media_info['video_resolution'].lower():
-            score += int(resolution_score)
-            log.debug("Added %d to score for video_resolution being %r", int(resolution_score), str(resolution))
-            break
-    # score filename
-    for filename_keyword, keyword_score in cfg['FILENAME_SCORES'].items():
-        for filename in media_info['file']:
-            if fnmatch(os.path.basename(filename.lower()), filename_keyword.lower()):
-                score += int(keyword_score)
-                log.debug("Added %d to score for match filename_keyword %s", int(keyword_score), filename_keyword)
-    # add bitrate to score
-    score += int(media_info['video_bitrate']) * 2
-    log.debug("Added %d to score for video bitrate", int(media_info['video_bitrate']) * 2)
-    # add duration to score
-    score += int(media_info['video_duration']) / 300
-    log.debug("Added %d to score for video duration", int(media_info['video_duration']) / 300)
-    # add width to score
-    score += int(media_info['video_width']) * 2
-    log.debug("Added %d to score for video width", int(media_info['video_width']) * 2)
-    # add height to score
-    score += int(media_info['video_height']) * 2
-    log.debug("Added %d to score for video height", int(media_info['video_height']) * 2)
-    # add audio channels to score
-    score += int(media_info['audio_channels']) * 1000
-    log.debug("Added %d to score for audio channels", int(media_info['audio_channels']) * 1000)
-    # add file size to score
-    if cfg['SCORE_FILESIZE']:
-        score += int(media_info['file_size']) / 100000
-        log.debug("Added %d to score for total file size", int(media_info['file_size']) / 100000)
-    return int(score)
+def get_updated_at(item):
+    return int(item.updatedAt.timestamp()) if item.updatedAt else 0
+
+
+def is_cached(server, item):
+    if server.media_cache is None:
+        return False
+    updated_at = get_updated_at(item)
+    return all(server.media_cache.contains(media.id, [part.file for part in media.parts], updated_at)
+               for media in item.media)
+
+
+def get_full_items(server, items):
+    # search results only carry partial metadata, Plex returns the full metadata (streams included) of many items
+    # in one request when their ratingKeys are joined with commas. Items whose media info is cached are skipped.
+    # plexapi still takes the returned items for partial objects (they were not loaded from their own key), reading
+    # an attribute of the item that is None or empty reloads it with a request of its own. The attributes read here
+    # are all present in the full metadata, the media and parts themselves never reload.
+    # Returns the items, the ratingKeys of those fetched in full and whether a request was made.
+    missing = [item for item in items if not is_cached(server, item)]
+    if not missing:
+        return items, set(), False
+    metadata_key = '/library/metadata/%s' % ','.join(str(item.ratingKey) for item in missing)
+    try:
+        with metrics.phase('metadata'):
+            full_items = {full_item.ratingKey: full_item for full_item in server.plex.fetchItems(metadata_key)}
+    except Exception:
+        log.exception("Exception occurred while fetching metadata batch %r, using search results instead",
+                      metadata_key)
+        return items, set(), True
+    return [full_items.get(item.ratingKey, item) for item in items], set(full_items), True
+
+
+def fetch_items(server, rating_keys):
+    # full metadata of the items, in one request, empty when it fails
+    metadata_key = '/library/metadata/%s' % ','.join(str(rating_key) for rating_key in rating_keys)
+    try:
+        with metrics.phase('metadata'):
+            return server.plex.fetchItems(metadata_key)
+    except Exception:
+        log.exception("Exception occurred while fetching metadata batch %r", metadata_key)
+        return []
 
 
 def get_media_info(item):
+    # only built to hold the values while they are looked up, the part is kept as a (much smaller) MediaPart
     info = {
         'id': 'Unknown',
         'video_bitrate': 0,
@@ -178,7 +259,7 @@ def get_media_info(item):
         for part in item.parts:
             for stream in part.audioStreams():
                 if stream.channels:
-                    log.debug(f"Added {stream.channels} channels for {stream.title if stream.title else 'Unknown'} audioStream")
+                    log.debug("Added %d channels for %s audioStream", stream.channels, stream.title or 'Unknown')
                     info['audio_channels'] += stream.channels
         if info['audio_channels'] == 0:
             info['audio_channels'] = item.audioChannels if item.audioChannels else 0
@@ -193,16 +274,68 @@ def get_media_info(item):
         info['file'].append(part.file)
         info['file_size'] += part.size if part.size else 0
 
-    return info
+    return MediaPart.from_dict(info)
 
 
-def delete_item(show_key, media_id):
-    delete_url = urljoin(cfg['PLEX_SERVER'], '%s/media/%d' % (show_key, media_id))
-    log.debug("Sending DELETE request to %r" % delete_url)
-    if requests.delete(delete_url, headers={'X-Plex-Token': cfg['PLEX_TOKEN']}).status_code == 200:
-        print("\t\tDeleted media item: %r" % media_id)
-    else:
-        print("\t\tError deleting media item: %r" % media_id)
+def get_item_title(item):
+    if item.type == 'episode':
+        return "%s - %02dx%02d - %s" % (item.grandparentTitle, int(item.parentIndex), int(item.index), item.title)
+    elif item.type == 'movie':
+        return item.title
+    return 'Unknown'
+
+
+def get_item_parts(server, item, full=True):
+    # loop returned parts for media item (copy 1, copy 2...), only the media info of a full item (not a search result
+    # standing in for it, which lacks the streams) is cached
+    media_cache = server.media_cache
+    parts = {}
+    updated_at = get_updated_at(item)
+    for part in item.media:
+        files = [media_part.file for media_part in part.parts]
+        cached = media_cache.get(part.id, files, updated_at) if media_cache is not None else None
+        if cached is not None:
+            part_info = MediaPart.from_dict(cached)
+        else:
+            # scored later on, together with every other part of the scan, see score_parts
+            part_info = get_media_info(part)
+            if media_cache is not None and full:
+                media_cache.put(part.id, files, updated_at, part_info.to_dict())
+        part_info.show_key = item.key
+        if server.name:
+            part_info.server = server.name
+        parts[part.id] = part_info
+    return parts
+
+
+def get_server(part_info):
+    # media without a server name belong to the first (or only) server
+    return servers_by_name.get(part_info.server) if part_info.server else servers[0]
+
+
+def delete_item(part_info):
+    media_id = part_info.id
+    server = get_server(part_info)
+    future = Future()
+    if server is None:
+        log.error("Unable to delete media item %r, server %r is not configured", media_id, part_info.server)
+        future.set_result(False)
+        return future
+    deleted_key = server.label(media_id)
+    if checkpoint is not None and deleted_key in checkpoint.deleted:
+        # confirmed by the run being resumed
+        future.set_result(True)
+        return future
+
+    future = server.deleter.submit(part_info.show_key, media_id)
+    if checkpoint is not None:
+        def record_deleted(done):
+            # cancelled when the run was interrupted before sending it
+            if not done.cancelled() and done.result():
+                checkpoint.record_deleted(deleted_key)
+
+        future.add_done_callback(record_deleted)
+    return future
 
 
 ############################################################
@@ -210,24 +343,172 @@ def delete_item(show_key, media_id):
 ############################################################
 
 decision_filename = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), 'decisions.log')
+decision_json_filename = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), 'decisions.jsonl')
+decision_writer = None
+
+
+checkpoint_filename = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), 'checkpoint.jsonl')
+checkpoint = None
+plan_filename = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), 'plan.jsonl')
+snapshot_filename = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), 'snapshot.jsonl')
+review_filename = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), 'review.csv')
+state_filename = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), 'state.json')
+cross_server_filename = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), 'cross_server.jsonl')
+
+
+def load_state():
+    if not os.path.exists(state_filename):
+        return {'sections': {}}
+    try:
+        with open(state_filename, 'r') as fp:
+            return json.load(fp)
+    except Exception:
+        log.exception("Exception occurred loading state from %r, starting over", state_filename)
+    return {'sections': {}}
+
+
+def save_state(state):
+    tmp_filename = state_filename + '.tmp'
+    with open(tmp_filename, 'w') as fp:
+        json.dump(state, fp, sort_keys=True, indent=2)
+    os.replace(tmp_filename, state_filename)
+
+
+# when every section was scanned by this run, with the (server, show_key) of its dupes, see scan_sections, and the
+# (server, show_key) of the dupes left undecided: skipped, or with a removal that failed
+section_scans = {}
+undecided = set()
+
+
+def leave_undecided(parts):
+    undecided.update((part_info.server, part_info.show_key) for part_info in parts)
+
 
+def finished_scans():
+    """ Returns {section: scan time} of the sections scanned by this run without any dupe left undecided. """
+    return {label: started for label, (started, keys) in section_scans.items() if keys.isdisjoint(undecided)}
 
-def write_decision(title=None, keeping=None, removed=None):
-    lines = []
-    if title:
-        lines.append('\nTitle    : %s\n' % title)
-    if keeping:
-        lines.append('\tKeeping  : %r\n' % keeping)
-    if removed:
-        lines.append('\tRemoving : %r\n' % removed)
 
-    with open(decision_filename, 'a') as fp:
-        fp.writelines(lines)
-    return
+def advance_scans(scans):
+    # incremental runs only look at items changed since, so the time of a scan is only stored once its dupes were
+    # dealt with, otherwise they would never be seen again
+    state = load_state()
+    for label, started in scans.items():
+        section_state = state['sections'].setdefault(label, {})
+        section_state['last_scan'] = max(started, section_state.get('last_scan', 0))
+    save_state(state)
+
+
+def hold_scans(filename):
+    # the scans behind a plan or review file are only stored once it is applied, see release_scans
+    state = load_state()
+    state.setdefault('held', {})[os.path.abspath(filename)] = finished_scans()
+    save_state(state)
+
+
+def release_scans(filename):
+    state = load_state()
+    scans = state.get('held', {}).pop(os.path.abspath(filename), {})
+    save_state(state)
+    if undecided:
+        print("Not storing the scan times behind %r, some of its titles were left undecided" % filename)
+        return
+    advance_scans(scans)
+
+
+def bounded_map(executor, func, iterable, limit):
+    """
+    Like executor.map, but never has more than limit calls in flight and yields results in input order.
+    """
+    pending = collections.deque()
+    for entry in iterable:
+        pending.append(executor.submit(func, entry))
+        if len(pending) >= limit:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+pending_decisions = collections.deque()
+
+
+def queue_decision(title, keeping, removals):
+    """
+    Queue a decision until its deletions are confirmed, removals are (part_info, future) pairs from delete_item.
+    """
+    pending_decisions.append((title, keeping, removals))
+    flush_decisions()
+
+
+def flush_decisions(wait=False):
+    # decisions are written in the order they were made, only listing removals Plex confirmed
+    while pending_decisions:
+        title, keeping, removals = pending_decisions[0]
+        if not wait and not all(future.done() for _, future in removals):
+            return
+        pending_decisions.popleft()
+        if checkpoint is not None and any(future.cancelled() for _, future in removals):
+            # the run was interrupted before all its removals were sent, --resume decides on the title again
+            continue
+        removed = []
+        for part_info, future in removals:
+            if not future.cancelled() and future.result():
+                print("\t\tDeleted media item: %r" % part_info.id)
+                removed.append(part_info)
+                if file_remover is not None:
+                    file_remover.submit(part_info, get_server(part_info).path_mappings, local_files(keeping))
+            else:
+                print("\t\tError deleting media item: %r" % part_info.id)
+                leave_undecided([keeping, part_info] if keeping else [part_info])
+        # written to decisions.log only once, --resume decides again on what the checkpoint does not list
+        with signals_deferred():
+            write_decision(title, keeping, removed)
+            if checkpoint is not None:
+                checkpoint.record_decided(title)
+
+
+@contextlib.contextmanager
+def signals_deferred(signums=(signal.SIGINT, signal.SIGTERM)):
+    """ Holds back Ctrl-C and SIGTERM while the block runs, they are handled as usual right after it. """
+    received = []
+    previous = {signum: signal.signal(signum, lambda signum, frame: received.append(signum)) for signum in signums}
+    try:
+        yield
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+        for signum in received:
+            signal.raise_signal(signum)
+
+
+def local_files(part_info):
+    # the files of a media item as seen from here, through the path mappings of its server
+    server = get_server(part_info) if part_info is not None else None
+    if server is None:
+        return []
+    return [map_path(path, server.path_mappings) for path in part_info.file]
+
+
+def write_decision(title, keeping=None, removed=()):
+    decision_writer.write(title, keeping, removed)
 
 
 def should_skip(files):
-    return any(skip_item in str(files_item) for files_item, skip_item in itertools.product(files, cfg['SKIP_LIST']))
+    return any(str(file) in skip_matcher for file in files)
+
+
+def is_skipped(item):
+    # every media item of the dupe has a file matching SKIP_LIST, so none of them would be removed in Auto Delete mode
+    return bool(item.media) and all(should_skip(part.file for part in media.parts) for media in item.media)
 
 
 def millis_to_string(millis):
@@ -280,40 +561,704 @@ def kbps_to_string(size_kbps):
     return "%d Bbps" % size_kbps
 
 
+def print_metrics():
+    from tabulate import tabulate
+
+    data = metrics.as_dict()
+    print("\nFinished in %.1f seconds" % data['duration_seconds'])
+    if data['phases']:
+        print(tabulate([(name, phase['calls'], "%.3fs" % phase['seconds']) for name, phase in data['phases'].items()],
+                       headers=['phase', 'calls', 'time']))
+    if data['endpoints']:
+        print()
+        rows = []
+        for entry in data['endpoints']:
+            rows.append([entry['method'], entry['endpoint'], entry['requests'], bytes_to_string(entry['bytes'])] +
+                        ["%d ms" % (entry['latency_p%d_seconds' % pct] * 1000) for pct in metrics.PERCENTILES])
+        print(tabulate(rows, headers=['method', 'endpoint', 'requests', 'received'] +
+                       ['p%d' % pct for pct in metrics.PERCENTILES]))
+
+
+# the columns of the table shown per title, and of the review file, with how every cell is formatted
+TABULATED_COLUMNS = collections.OrderedDict([
+    ('score', lambda part_info: str(format(part_info.score, ',d'))),
+    ('id', lambda part_info: part_info.id),
+    ('file', lambda part_info: list(part_info.file)),
+    ('size', lambda part_info: bytes_to_string(part_info.file_size)),
+    ('duration', lambda part_info: millis_to_string(part_info.video_duration)),
+    ('bitrate', lambda part_info: kbps_to_string(part_info.video_bitrate)),
+    ('resolution', lambda part_info: "%s (%d x %d)" % (part_info.video_resolution, part_info.video_width,
+                                                       part_info.video_height)),
+    ('codecs', lambda part_info: "%s, %s x %d" % (part_info.video_codec, part_info.audio_codec,
+                                                  part_info.audio_channels)),
+])
+
+
+def tabulated_headers():
+    return [header for header in TABULATED_COLUMNS
+            if header != 'score' or not cfg['FIND_DUPLICATE_FILEPATHS_ONLY']]
+
+
 def build_tabulated(parts, items):
-    headers = ['choice', 'score', 'id', 'file', 'size', 'duration', 'bitrate', 'resolution',
-               'codecs']
+    headers = tabulated_headers()
+    formatters = [TABULATED_COLUMNS[header] for header in headers]
+    part_data = [[choice] + [formatter(parts[item_id]) for formatter in formatters]
+                 for choice, item_id in items.items()]
+    return ['choice'] + headers, part_data
+
+
+############################################################
+# PROCESSING METHODS
+############################################################
+
+
+def scan_section(server, section, since, metadata_executor, prune_skipped=False):
+    started = time.time()
+    label = server.label(section)
+    section_parts = {}
+    metadata_requests = 0
+    pruned = []
+    # loop returned duplicates as they are paged in, fetching their full metadata in parallel batches
+    dupes = (dupe for dupe in get_dupes(server, section, since)
+             if (label, dupe.ratingKey) not in checkpoint.items_done)
+    if prune_skipped:
+        # the search results already list the files, dupes that would all be skipped need no metadata
+        dupes = prune_skipped_dupes(dupes, pruned)
+    for items, full, requested in bounded_map(metadata_executor, functools.partial(get_full_items, server),
+                                              chunked(dupes, cfg['METADATA_BATCH_SIZE']),
+                                              cfg['METADATA_WORKERS'] * 2):
+        metadata_requests += requested
+        for item in items:
+            title = server.label(get_item_title(item))
+            log.info("Processing: %r", title)
+            section_parts[title] = get_item_parts(server, item, item.ratingKey in full)
+            checkpoint.record_item(label, item.ratingKey, title, section_parts[title])
+    return section_parts, metadata_requests, len(pruned), time.time() - started
+
+
+def prune_skipped_dupes(dupes, pruned):
+    # passes on the dupes of which something could be removed, appending the others to pruned
+    for dupe in dupes:
+        if is_skipped(dupe):
+            log.info("Skipping %r, the files of all its media items match SKIP_LIST", get_item_title(dupe))
+            pruned.append(dupe.ratingKey)
+            continue
+        yield dupe
+
+
+def index_guids(server, section):
+    # every item of the section, not only the dupes, keyed by the agent guid shared between servers
+    guids = {}
+    for item in search_pages(server.section(section), libtype=get_section_type(server, section)):
+        if item.guid:
+            guids[item.guid] = {'server': server.name, 'section': section, 'title': get_item_title(item),
+                                'key': item.key}
+    return guids
+
+
+def fingerprint_section(server, section, metadata_executor, hash_executor):
+    """
+    Groups every media item of the section by content (see FingerprintIndex), to find the copies Plex keeps as
+    separate items. Returns [(item titles, {media_id: part_info})] of the groups spanning more than one item, the
+    index and the time taken.
+    """
+    started = time.time()
+    index = FingerprintIndex(server.path_mappings)
+    for item in search_pages(server.section(section), libtype=get_section_type(server, section)):
+        for media in item.media:
+            index.add((item.ratingKey, media.id), [part.file for part in media.parts],
+                      [part.size for part in media.parts])
+    with metrics.phase('fingerprint'):
+        # copies of a single item are the duplicates Plex already matched
+        groups = [keys for keys in index.groups(hash_executor) if len({rating_key for rating_key, _ in keys}) > 1]
+
+    rating_keys = list(dict.fromkeys(rating_key for keys in groups for rating_key, _ in keys))
+    items = {}
+    for fetched in bounded_map(metadata_executor, functools.partial(fetch_items, server),
+                               chunked(rating_keys, cfg['METADATA_BATCH_SIZE']), cfg['METADATA_WORKERS'] * 2):
+        for item in fetched:
+            items[item.ratingKey] = (server.label(get_item_title(item)), get_item_parts(server, item))
+
+    found = []
+    for keys in groups:
+        titles = []
+        parts = {}
+        for rating_key, media_id in keys:
+            title, item_parts = items.get(rating_key, (None, {}))
+            if media_id in item_parts:
+                titles.append(title)
+                parts[media_id] = item_parts[media_id]
+        if len(parts) > 1:
+            found.append((titles, parts))
+    return found, index, time.time() - started
+
+
+def merge_fingerprint_groups(process_later, found):
+    """
+    Adds the groups found by fingerprint_section to process_later, titled by the titles of their items. A title found
+    by the duplicate search that shares an item with a group is folded into that group, so every media item is still
+    decided on once.
+    """
+    owners = {}
+    names = {}
+    for title, parts in process_later.items():
+        names[title] = [title]
+        for part_info in parts.values():
+            owners[(part_info.server, part_info.show_key)] = title
+
+    for titles, parts in found:
+        merged_names = []
+        merged_parts = {}
+        for part_info in parts.values():
+            owner = owners.get((part_info.server, part_info.show_key))
+            if owner in process_later:
+                merged_names.extend(names.pop(owner))
+                merged_parts.update(process_later.pop(owner))
+        merged_names = list(dict.fromkeys(merged_names + titles))
+        merged_parts.update(parts)
+        title = ' = '.join(merged_names)
+        names[title] = merged_names
+        process_later[title] = merged_parts
+        for part_info in merged_parts.values():
+            owners[(part_info.server, part_info.show_key)] = title
+
+
+def write_cross_server_report(guid_index, report_filename):
+    # one JSON object per title found on more than one server, for review only, nothing is deleted
+    reported = 0
+    with open(report_filename, 'w') as fp:
+        for guid, entries in guid_index.items():
+            if len({entry['server'] for entry in entries}) < 2:
+                continue
+            fp.write(json.dumps({'guid': guid, 'items': entries}, separators=(',', ':')) + '\n')
+            reported += 1
+    print("Found %d title(s) present on more than one server, wrote them to %r" % (reported, report_filename))
+
+
+def scan_sections(full=False, prune_skipped=False):
+    # start from whatever the run being resumed already scanned
+    process_later = dict(checkpoint.titles)
+    incremental = cfg['INCREMENTAL_SCAN'] and not full
+    cross_server = cfg['CROSS_SERVER_REPORT'] and len(servers) > 1
+    # with FIND_DUPLICATE_FILEPATHS_ONLY only copies sharing a path are dupes, content does not matter
+    fingerprint = cfg['FINGERPRINT_DUPES'] and not cfg['FIND_DUPLICATE_FILEPATHS_ONLY']
+    state = load_state()
+    results = {}
+    guid_index = collections.defaultdict(list)
+    # resolve every library once, before the section workers need them
+    for server in servers:
+        for section in server.libraries:
+            get_section_type(server, section)
+    with contextlib.ExitStack() as stack:
+        futures = {}
+        guid_futures = []
+        fingerprint_futures = []
+        # files of every server are read by the same workers, FINGERPRINT_WORKERS at a time
+        hash_executor = stack.enter_context(ThreadPoolExecutor(max_workers=cfg['FINGERPRINT_WORKERS'])) \
+            if fingerprint else None
+        # servers are scanned at the same time, each with its own section and metadata workers
+        for server in servers:
+            metadata_executor = stack.enter_context(ThreadPoolExecutor(max_workers=cfg['METADATA_WORKERS']))
+            section_executor = stack.enter_context(ThreadPoolExecutor(max_workers=cfg['SECTION_WORKERS']))
+            for section in server.libraries:
+                label = server.label(section)
+                if cross_server:
+                    guid_futures.append(section_executor.submit(index_guids, server, section))
+                if fingerprint:
+                    fingerprint_futures.append((label, section_executor.submit(fingerprint_section, server, section,
+                                                                               metadata_executor, hash_executor)))
+                if label in checkpoint.sections_done:
+                    print("Skipping section %r, it was scanned by the run being resumed" % label)
+                    continue
+                since = state['sections'].get(label, {}).get('last_scan') if incremental else None
+                if since is not None:
+                    print("Finding dupes for section %r added or updated since %s..."
+                          % (label, datetime.fromtimestamp(since)))
+                else:
+                    print("Finding dupes for section %r..." % label)
+                futures[section_executor.submit(scan_section, server, section, since, metadata_executor,
+                                                prune_skipped)] = (label, int(time.time()))
+
+        # report sections as they finish
+        for future in as_completed(futures):
+            label, scan_started = futures[future]
+            section_parts, metadata_requests, pruned, elapsed = future.result()
+            results[label] = section_parts
+            print("Found %d dupes for section %r in %.1f seconds, fetching their metadata in %d batch request(s)"
+                  % (len(section_parts), label, elapsed, metadata_requests))
+            if pruned:
+                print("Skipped %d dupes for section %r without fetching their metadata, the files of all their media "
+                      "items match SKIP_LIST" % (pruned, label))
+            # remember when this section was scanned, stored for the next incremental run once its dupes are dealt
+            # with (see advance_scans)
+            section_scans[label] = (scan_started, {(part_info.server, part_info.show_key)
+                                                   for parts in section_parts.values() for part_info in parts.values()})
+            checkpoint.record_section(label)
+
+        # guids are merged in configured order, like the dupes below
+        for future in guid_futures:
+            for guid, entry in future.result().items():
+                guid_index[guid].append(entry)
+
+        fingerprinted = []
+        for label, future in fingerprint_futures:
+            found, index, elapsed = future.result()
+            fingerprinted.extend(found)
+            print("Fingerprinted %d media items of section %r in %.1f seconds, reading %d files (%s) of the %d sharing "
+                  "their size, found %d group(s) of copies Plex did not match"
+                  % (index.media_items, label, elapsed, index.files_read, bytes_to_string(index.bytes_read),
+                     index.sharing_size, len(found)))
+    # as counted by the requests made, items plexapi reloaded included
+    print("Made %d metadata request(s) to Plex while scanning"
+          % metrics.endpoint_requests('GET', '/library/metadata/{id}'))
+    if cross_server:
+        write_cross_server_report(guid_index, cross_server_filename)
+
+    # merge in configured order, so the output does not depend on which section finished first
+    for server in servers:
+        for section in server.libraries:
+            process_later.update(results.get(server.label(section), {}))
+    if fingerprint:
+        merge_fingerprint_groups(process_later, fingerprinted)
+
+    score_parts(process_later)
+    for server in servers:
+        if server.media_cache is not None:
+            server.media_cache.close()
+    return process_later
+
+
+def score_parts(process_later):
+    # every part without a (cached) score is scored in one batch, the new scores are cached for the next run
+    unscored = [part_info for parts in process_later.values() for part_info in parts.values()
+                if part_info.score is None]
+    if unscored and not cfg['FIND_DUPLICATE_FILEPATHS_ONLY']:
+        with metrics.phase('scoring'):
+            scores = scorer.score_batch(unscored)
+        for part_info, score in zip(unscored, scores):
+            part_info.score = score
+            server = get_server(part_info)
+            if server is not None and server.media_cache is not None:
+                server.media_cache.put_score(part_info.id, score)
+
+    if log.isEnabledFor(logging.INFO):
+        for parts in process_later.values():
+            for media_id, part_info in parts.items():
+                score = part_info.score if part_info.score is not None else 'N/A'
+                log.info("ID: %r - Score: %s - Meta:\n%r", media_id, score, part_info)
+
+
+def choose_keeps(titles):
+    """
+    Picks the media item to keep of every title in one grouped pass: the highest score above 0, or the lowest id
+    with FIND_DUPLICATE_FILEPATHS_ONLY. Ties go to the first media item. Returns {title: media id or None}.
+    """
+    with metrics.phase('decision'):
+        groups = []
+        values = []
+        media_ids = []
+        for title, parts in titles.items():
+            for media_id, part_info in parts.items():
+                groups.append(title)
+                media_ids.append(media_id)
+                if cfg['FIND_DUPLICATE_FILEPATHS_ONLY']:
+                    values.append(-int(part_info.id))
+                else:
+                    values.append(int(part_info.score))
+        winners = grouped_argmax(groups, values, None if cfg['FIND_DUPLICATE_FILEPATHS_ONLY'] else 0)
+        return {title: media_ids[pos] if pos is not None else None for title, pos in winners.items()}
+
+
+def process_titles(process_later, decided=()):
+    keeps = choose_keeps(process_later) if cfg['AUTO_DELETE'] else {}
+    for item, parts in process_later.items():
+        if item in decided:
+            continue
+        if not cfg['AUTO_DELETE']:
+            # manual delete
+            process_manual(item, parts)
+        else:
+            # auto delete
+            process_auto(item, parts, keeps.get(item))
+
+
+def process_manual(item, parts):
+    from tabulate import tabulate
+
+    partz = {}
+    print("\nWhich media item do you wish to keep for %r ?\n" % item)
+
+    sort_key = None
+    sort_order = None
+
+    if cfg['FIND_DUPLICATE_FILEPATHS_ONLY']:
+        sort_key = "id"
+        sort_order_reverse = False
+    else:
+        sort_key = "score"
+        sort_order_reverse = True
+
+    media_items = {}
+    best_item = None
+    with metrics.phase('decision'):
+        for pos, (media_id, part_info) in enumerate(collections.OrderedDict(
+                sorted(parts.items(), key=lambda x: getattr(x[1], sort_key),
+                       reverse=sort_order_reverse)).items(), start=1):
+            if pos == 1:
+                best_item = part_info
+            media_items[pos] = media_id
+            partz[media_id] = part_info
+
+        headers, data = build_tabulated(partz, media_items)
+    print(tabulate(data, headers=headers))
+
+    keep_item = input("\nChoose item to keep (0 or s = skip | 1 or b = best): ")
+    if (keep_item.lower() != 's') and (keep_item.lower() == 'b' or 0 < int(keep_item) <= len(media_items)):
+        keeping = None
+        removals = []
+        for media_id, part_info in parts.items():
+            if keep_item.lower() == 'b' and best_item is not None and best_item == part_info:
+                print("\tKeeping  : %r" % media_id)
+                keeping = part_info
+            elif keep_item.lower() != 'b' and len(media_items) and media_id == media_items[int(keep_item)]:
+                print("\tKeeping  : %r" % media_id)
+                keeping = part_info
+            else:
+                print("\tRemoving : %r" % media_id)
+                removals.append((part_info, delete_item(part_info)))
+        queue_decision(item, keeping, removals)
+    elif keep_item.lower() == 's' or int(keep_item) == 0:
+        print("Skipping deletion(s) for %r" % item)
+        leave_undecided(parts.values())
+        if checkpoint is not None:
+            checkpoint.record_decided(item)
+    else:
+        print("Unexpected response, skipping deletion(s) for %r" % item)
+        leave_undecided(parts.values())
+
+
+def process_auto(item, parts, keep_id):
+    print("\nDetermining best media item to keep for %r ..." % item)
+
+    if keep_id:
+        # delete other items
+        keeping = None
+        removals = []
+        for media_id, part_info in parts.items():
+            if media_id == keep_id:
+                print("\tKeeping  : %r - %r" % (media_id, list(part_info.file)))
+                keeping = part_info
+            else:
+                print("\tRemoving : %r - %r" % (media_id, list(part_info.file)))
+                if should_skip(part_info.file):
+                    print("\tSkipping removal of this item as there is a match in SKIP_LIST")
+                    continue
+                removals.append((part_info, delete_item(part_info)))
+        queue_decision(item, keeping, removals)
+    else:
+        print("Unable to determine best media item to keep for %r", item)
+        leave_undecided(parts.values())
+
+
+def write_plan(process_later, plan_filename):
+    # one JSON object per title, so the plan can be streamed back in by apply_plan
+    planned = 0
+    keeps = choose_keeps(process_later)
+    with open(plan_filename, 'w') as fp:
+        for item, parts in process_later.items():
+            keep_id = keeps.get(item)
+            if not keep_id:
+                print("Unable to determine best media item to keep for %r" % item)
+                leave_undecided(parts.values())
+                continue
+            entry = {'title': item, 'keep': parts[keep_id].to_dict(), 'remove': [], 'skip': []}
+            for media_id, part_info in parts.items():
+                if media_id == keep_id:
+                    continue
+                entry['skip' if should_skip(part_info.file) else 'remove'].append(part_info.to_dict())
+            fp.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            planned += len(entry['remove'])
+    print("Wrote plan to remove %d media item(s) of %d title(s) to %r" % (planned, len(process_later), plan_filename))
+
+
+def apply_plan(plan_filename):
+    with open(plan_filename, 'r') as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry['title'] in checkpoint.decided:
+                continue
+            keeping = MediaPart.from_dict(entry['keep'])
+            print("\nApplying plan for %r ..." % entry['title'])
+            print("\tKeeping  : %r - %r" % (keeping.id, list(keeping.file)))
+            removals = []
+            for part_info in map(MediaPart.from_dict, entry['remove']):
+                print("\tRemoving : %r - %r" % (part_info.id, list(part_info.file)))
+                removals.append((part_info, delete_item(part_info)))
+            for part_info in map(MediaPart.from_dict, entry['skip']):
+                print("\tSkipping : %r - %r" % (part_info.id, list(part_info.file)))
+            queue_decision(entry['title'], keeping, removals)
+
+
+def write_review(process_later, review_filename):
+    """
+    Writes every title to a CSV file to review offline, one row per media item with the columns shown in manual mode,
+    best first, and the media info as JSON for apply_review. The keep column is marked on the best media item.
+    """
+    headers = tabulated_headers()
+    formatters = [TABULATED_COLUMNS[header] for header in headers]
+    sort_key = 'id' if cfg['FIND_DUPLICATE_FILEPATHS_ONLY'] else 'score'
+    keeps = choose_keeps(process_later)
+    tmp_filename = review_filename + '.tmp'
+    rows = 0
+    with open(tmp_filename, 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(['title', 'keep'] + headers + ['media'])
+        for item, parts in process_later.items():
+            for media_id, part_info in sorted(parts.items(), key=lambda x: getattr(x[1], sort_key),
+                                              reverse=sort_key == 'score'):
+                writer.writerow([item, 'x' if media_id == keeps.get(item) else ''] +
+                                [formatter(part_info) for formatter in formatters] +
+                                [json.dumps(part_info.to_dict(), separators=(',', ':'))])
+                rows += 1
+    os.replace(tmp_filename, review_filename)
+    print("Wrote %d media item(s) of %d title(s) to review to %r, mark the media items to keep in its keep column "
+          "and run apply-review" % (rows, len(process_later), review_filename))
+
+
+def apply_review(review_filename):
+    """
+    Removes the media items not marked to keep in a review file written by write_review, whatever order its rows
+    were sorted in. Titles without any media item marked are left alone.
+    """
+    titles = collections.OrderedDict()
+    with open(review_filename, 'r', newline='') as fp:
+        for row in csv.DictReader(fp):
+            titles.setdefault(row['title'], []).append((bool(row['keep'].strip()),
+                                                        MediaPart.from_dict(json.loads(row['media']))))
+
+    for title, rows in titles.items():
+        if title in checkpoint.decided:
+            continue
+        kept = [part_info for keep, part_info in rows if keep]
+        if not kept:
+            print("\nNo media item marked to keep for %r, skipping" % title)
+            leave_undecided(part_info for _, part_info in rows)
+            continue
+        print("\nApplying review of %r ..." % title)
+        removals = []
+        for keep, part_info in rows:
+            if keep:
+                print("\tKeeping  : %r - %r" % (part_info.id, list(part_info.file)))
+            else:
+                print("\tRemoving : %r - %r" % (part_info.id, list(part_info.file)))
+                removals.append((part_info, delete_item(part_info)))
+        queue_decision(title, kept[0], removals)
+
+
+def delete_files(decisions_filename):
+    """
+    Removes the files of every media item listed as removed in decisions.log (through the file removal settings),
+    e.g. for decisions made before DELETE_FILES was enabled. Plex is not contacted.
+    """
+    from deletion import FileRemover
+
+    path_mappings = {server_config['NAME']: server_config['PATH_MAPPINGS'] for server_config in server_configs(cfg)}
+    remover = FileRemover(cfg['DELETE_FILES_WORKERS'], cfg['DELETE_FILES_DRY_RUN'])
+    keep_paths = []
+    with open(decisions_filename, 'r') as fp:
+        for line in fp:
+            if line.startswith('Title    : '):
+                keep_paths = []
+            elif line.startswith('\tKeeping  : '):
+                keeping = MediaPart.from_dict(ast.literal_eval(line[len('\tKeeping  : '):]))
+                keep_paths = [map_path(path, path_mappings.get(keeping.server or '', {})) for path in keeping.file]
+            elif line.startswith('\tRemoving : '):
+                part_info = MediaPart.from_dict(ast.literal_eval(line[len('\tRemoving : '):]))
+                remover.submit(part_info, path_mappings.get(part_info.server or '', {}), keep_paths)
+    remover.shutdown()
+    print(remover.summary())
+
+
+def write_snapshot(process_later, snapshot_filename):
+    # the media info of every duplicate title, without scores, so it can be rescored offline by whatif
+    tmp_filename = snapshot_filename + '.tmp'
+    parts_count = 0
+    with open(tmp_filename, 'w') as fp:
+        for item, parts in process_later.items():
+            snapshot_parts = []
+            for part_info in parts.values():
+                info = part_info.to_dict()
+                info.pop('score', None)
+                snapshot_parts.append(info)
+            fp.write(json.dumps({'title': item, 'parts': snapshot_parts}, separators=(',', ':')) + '\n')
+            parts_count += len(snapshot_parts)
+    os.replace(tmp_filename, snapshot_filename)
+    print("Wrote snapshot of %d media item(s) of %d title(s) to %r" % (parts_count, len(process_later),
+                                                                       snapshot_filename))
+
+
+def load_snapshot(snapshot_filename):
+    titles = {}
+    with open(snapshot_filename, 'r') as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            titles[entry['title']] = {part_info['id']: MediaPart.from_dict(part_info) for part_info in entry['parts']}
+    return titles
+
+
+def what_if(snapshot_filename, candidate_filename):
+    """
+    Rescores a snapshot with the current scoring settings and with those of a candidate config, printing every
+    title whose kept media item would change. Plex is not contacted.
+    """
+    with open(candidate_filename, 'r') as fp:
+        candidate_settings = json.load(fp)
+    ignored = sorted(key for key in candidate_settings if key not in SCORING_KEYS)
+    if ignored:
+        print("Ignoring settings of %r that do not affect scores: %s" % (candidate_filename, ', '.join(ignored)))
     if cfg['FIND_DUPLICATE_FILEPATHS_ONLY']:
-        headers.remove('score')
-
-    part_data = []
-
-    for choice, item_id in items.items():
-        # add to part_data
-        tmp = []
-        for k in headers:
-            if 'choice' in k:
-                tmp.append(choice)
-            elif 'score' in k:
-                tmp.append(str(format(parts[item_id][k], ',d')))
-            elif 'id' in k:
-                tmp.append(parts[item_id][k])
-            elif 'file' in k:
-                tmp.append(parts[item_id][k])
-            elif 'size' in k:
-                tmp.append(bytes_to_string(parts[item_id]['file_size']))
-            elif 'duration' in k:
-                tmp.append(millis_to_string(parts[item_id]['video_duration']))
-            elif 'bitrate' in k:
-                tmp.append(kbps_to_string(parts[item_id]['video_bitrate']))
-            elif 'resolution' in k:
-                tmp.append("%s (%d x %d)" % (parts[item_id]['video_resolution'], parts[item_id]['video_width'],
-                                             parts[item_id]['video_height']))
-            elif 'codecs' in k:
-                tmp.append("%s, %s x %d" % (parts[item_id]['video_codec'], parts[item_id]['audio_codec'],
-                                            parts[item_id]['audio_channels']))
-        part_data.append(tmp)
-    return headers, part_data
+        print("Note: FIND_DUPLICATE_FILEPATHS_ONLY is enabled, so runs keep the lowest id whatever the scores")
+    candidate_cfg = dict(cfg)
+    candidate_cfg.update({key: value for key, value in candidate_settings.items() if key in SCORING_KEYS})
+
+    titles = load_snapshot(snapshot_filename)
+    groups = []
+    parts = []
+    for item, item_parts in titles.items():
+        for part_info in item_parts.values():
+            groups.append(item)
+            parts.append(part_info)
+
+    started = time.time()
+    current_scores = scorer.score_batch(parts, log_scores=False)
+    candidate_scores = MediaScorer(candidate_cfg).score_batch(parts, log_scores=False)
+    current_keeps = grouped_argmax(groups, current_scores, 0)
+    candidate_keeps = grouped_argmax(groups, candidate_scores, 0)
+    elapsed = time.time() - started
+
+    changed = 0
+    for item in titles:
+        current_pos = current_keeps.get(item)
+        candidate_pos = candidate_keeps.get(item)
+        if current_pos == candidate_pos:
+            continue
+        changed += 1
+        print("\n%s" % item)
+        for label, pos, scores in (('Current  ', current_pos, current_scores),
+                                   ('Candidate', candidate_pos, candidate_scores)):
+            if pos is None:
+                print("\t%s: no media item to keep" % label)
+            else:
+                print("\t%s: keep %r (score %s) - %r" % (label, parts[pos].id, format(scores[pos], ',d'),
+                                                         list(parts[pos].file)))
+
+    print("\nRescored %d media item(s) of %d title(s) in %.2f seconds, the kept media item changes for %d title(s)"
+          % (len(parts), len(titles), elapsed, changed))
+
+
+def handle_alert(server, sections_by_id, debouncer, data):
+    # called from the alert listener thread, only records the change
+    for section_id, rating_key in library_changes(data):
+        section = sections_by_id.get(section_id)
+        if section is None:
+            continue
+        if rating_key is None:
+            log.debug("Plex finished scanning section %r", server.label(section))
+            debouncer.flush((server, section))
+        else:
+            debouncer.add((server, section), rating_key)
+
+
+def watch_section(server, section, rating_keys, since, metadata_executor):
+    """
+    Looks for dupes among the changed items of a section, or among every item changed since since when rating_keys
+    is None, and decides on them like a scan would.
+    """
+    started = time.time()
+    if rating_keys is None:
+        # updatedAt of an item can predate the alert about it by a little
+        dupes = get_dupes(server, section, since - 60)
+        if cfg['AUTO_DELETE'] and cfg['SKIP_LIST']:
+            dupes = prune_skipped_dupes(dupes, [])
+        batches = bounded_map(metadata_executor, functools.partial(get_full_items, server),
+                              chunked(dupes, cfg['METADATA_BATCH_SIZE']), cfg['METADATA_WORKERS'] * 2)
+        items = ((item, item.ratingKey in full) for batch, full, _ in batches for item in batch)
+    else:
+        batches = bounded_map(metadata_executor, functools.partial(fetch_items, server),
+                              chunked(rating_keys, cfg['METADATA_BATCH_SIZE']), cfg['METADATA_WORKERS'] * 2)
+        items = ((item, True) for batch in batches for item in batch if has_dupes(item))
+
+    process_later = {}
+    for item, full in items:
+        title = server.label(get_item_title(item))
+        log.info("Processing: %r", title)
+        process_later[title] = get_item_parts(server, item, full)
+    print("Found %d dupes among %s changed item(s) of section %r in %.1f seconds"
+          % (len(process_later), len(rating_keys) if rating_keys is not None else 'all', server.label(section),
+             time.time() - started))
+    if process_later:
+        score_parts(process_later)
+        process_titles(process_later)
+
+
+def watch():
+    """
+    Keeps listening to the library notifications of every server, deciding on the dupes among the items Plex reports
+    added or updated as they come in, until interrupted.
+    """
+    try:
+        import websocket  # noqa: F401
+    except ImportError:
+        print("watch needs the websocket-client package: sudo python3 -m pip install websocket-client")
+        sys.exit(1)
+
+    debouncer = SectionDebouncer(cfg['WATCH_DEBOUNCE'], cfg['WATCH_QUEUE_SIZE'])
+    listeners = {}
+    try:
+        with ThreadPoolExecutor(max_workers=cfg['METADATA_WORKERS']) as metadata_executor:
+            while True:
+                # (re)connect listeners whose websocket closed
+                for server in servers:
+                    listener = listeners.get(server)
+                    if listener is not None and listener.is_alive():
+                        continue
+                    sections_by_id = {str(server.section(section).key): section for section in server.libraries}
+                    if listener is None:
+                        print("Watching %s for new dupes..." % ', '.join(map(repr, map(server.label,
+                                                                                      server.libraries))))
+                    else:
+                        print("Lost the connection to %s, reconnecting" % server.url)
+                    listeners[server] = server.plex.startAlertListener(
+                        functools.partial(handle_alert, server, sections_by_id, debouncer),
+                        lambda error: log.error("Alert listener error: %s", error))
+
+                try:
+                    (server, section), rating_keys, since = debouncer.queue.get(timeout=10)
+                except queue.Empty:
+                    pass
+                else:
+                    try:
+                        watch_section(server, section, rating_keys, since, metadata_executor)
+                    except Exception:
+                        log.exception("Exception occurred while processing changes of section %r",
+                                      server.label(section))
+                flush_decisions()
+                decision_writer.flush()
+    finally:
+        debouncer.stop()
+        for listener in listeners.values():
+            try:
+                listener.stop()
+            except AttributeError:
+                # its websocket was not opened yet
+                pass
+        for server in servers:
+            if server.media_cache is not None:
+                server.media_cache.close()
 
 
 ############################################################
@@ -321,6 +1266,35 @@ def build_tabulated(parts, items):
 ############################################################
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find and remove duplicate media from Plex.")
+    parser.add_argument('command', nargs='?', default='run',
+                        choices=['run', 'plan', 'apply', 'snapshot', 'whatif', 'watch', 'review', 'apply-review',
+                                 'delete-files'],
+                        help="run: find and remove dupes (default), plan: write the removals to a plan file, "
+                             "apply: remove the media listed in a plan file without scanning Plex, "
+                             "snapshot: write the media info of all dupes to a snapshot file, "
+                             "whatif: show how the decisions on a snapshot change with the scores of --candidate, "
+                             "watch: keep running, removing dupes as Plex reports items added or updated, "
+                             "review: write all dupes to a review file to mark the media items to keep in, "
+                             "apply-review: remove the media items not marked in a review file, "
+                             "delete-files: remove the files of the media items removed in decisions.log")
+    parser.add_argument('--full', action='store_true',
+                        help="scan every duplicate, even when INCREMENTAL_SCAN is enabled")
+    parser.add_argument('--plan-file', default=plan_filename,
+                        help="plan file written by plan and read by apply (default: %(default)s)")
+    parser.add_argument('--resume', action='store_true',
+                        help="carry on from the checkpoint of an interrupted run")
+    parser.add_argument('--snapshot-file', default=snapshot_filename,
+                        help="snapshot file written by snapshot and read by whatif (default: %(default)s)")
+    parser.add_argument('--review-file', default=review_filename,
+                        help="review file written by review and read by apply-review (default: %(default)s)")
+    parser.add_argument('--candidate', metavar='CONFIG',
+                        help="JSON file with the *_SCORES settings to try out with whatif")
+    args = parser.parse_args()
+    if args.command == 'whatif' and not args.candidate:
+        parser.error("whatif needs a --candidate config")
+    init(args.command)
+
     print("""
        _                 _                   __ _           _
  _ __ | | _____  __   __| |_   _ _ __   ___ / _(_)_ __   __| | ___ _ __
@@ -338,121 +1312,88 @@ if __name__ == "__main__":
 #                   GNU General Public License v3.0                     #
 #########################################################################
 """)
-    print("Initialized")
-    process_later = {}
-    # process sections
-    print("Finding dupes...")
-    for section in cfg['PLEX_LIBRARIES']:
-        dupes = get_dupes(section)
-        print("Found %d dupes for section %r" % (len(dupes), section))
-        # loop returned duplicates
-        for item in dupes:
-            if item.type == 'episode':
-                title = "%s - %02dx%02d - %s" % (
-                    item.grandparentTitle, int(item.parentIndex), int(item.index), item.title)
-            elif item.type == 'movie':
-                title = item.title
-            else:
-                title = 'Unknown'
-
-            log.info("Processing: %r", title)
-            # loop returned parts for media item (copy 1, copy 2...)
-            parts = {}
-            for part in item.media:
-                part_info = get_media_info(part)
-                if not cfg['FIND_DUPLICATE_FILEPATHS_ONLY']:
-                    part_info['score'] = get_score(part_info)
-                part_info['show_key'] = item.key
-                log.info("ID: %r - Score: %s - Meta:\n%r", part.id, part_info.get('score', 'N/A'),
-                         part_info)
-                parts[part.id] = part_info
-            process_later[title] = parts
-
-    # process processed items
-    time.sleep(5)
-    for item, parts in process_later.items():
-        if not cfg['AUTO_DELETE']:
-            partz = {}
-            # manual delete
-            print("\nWhich media item do you wish to keep for %r ?\n" % item)
-
-            sort_key = None
-            sort_order = None
+    if args.command == 'whatif':
+        what_if(args.snapshot_file, args.candidate)
+        sys.exit(0)
+    if args.command == 'delete-files':
+        delete_files(decision_filename)
+        sys.exit(0)
 
-            if cfg['FIND_DUPLICATE_FILEPATHS_ONLY']:
-                sort_key = "id"
-                sort_order_reverse = False
-            else:
-                sort_key = "score"
-                sort_order_reverse = True
-
-            media_items = {}
-            best_item = None
-            for pos, (media_id, part_info) in enumerate(collections.OrderedDict(
-                    sorted(parts.items(), key=lambda x: x[1][sort_key], reverse=sort_order_reverse)).items(), start=1):
-                if pos == 1:
-                    best_item = part_info
-                media_items[pos] = media_id
-                partz[media_id] = part_info
-
-            headers, data = build_tabulated(partz, media_items)
-            print(tabulate(data, headers=headers))
-
-            keep_item = input("\nChoose item to keep (0 or s = skip | 1 or b = best): ")
-            if (keep_item.lower() != 's') and (keep_item.lower() == 'b' or 0 < int(keep_item) <= len(media_items)):
-                write_decision(title=item)
-                for media_id, part_info in parts.items():
-                    if keep_item.lower() == 'b' and best_item is not None and best_item == part_info:
-                        print("\tKeeping  : %r" % media_id)
-                        write_decision(keeping=part_info)
-                    elif keep_item.lower() != 'b' and len(media_items) and media_id == media_items[int(keep_item)]:
-                        print("\tKeeping  : %r" % media_id)
-                        write_decision(keeping=part_info)
-                    else:
-                        print("\tRemoving : %r" % media_id)
-                        delete_item(part_info['show_key'], media_id)
-                        write_decision(removed=part_info)
-                        time.sleep(2)
-            elif keep_item.lower() == 's' or int(keep_item) == 0:
-                print("Skipping deletion(s) for %r" % item)
-            else:
-                print("Unexpected response, skipping deletion(s) for %r" % item)
+    connect_servers()
+    print("Initialized")
+    # exit cleanly on SIGTERM, so buffered decisions are flushed and the checkpoint is kept
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    # watch decides on titles again whenever they change, so it keeps no checkpoint
+    checkpoint = Checkpoint(checkpoint_filename, resume=args.resume, interval=cfg['CHECKPOINT_INTERVAL']) \
+        if args.command != 'watch' else None
+    try:
+        if args.command == 'apply':
+            apply_plan(args.plan_file)
+        elif args.command == 'apply-review':
+            apply_review(args.review_file)
+        elif args.command == 'watch':
+            try:
+                watch()
+            except KeyboardInterrupt:
+                print("\nStopped watching")
         else:
-            # auto delete
-            print("\nDetermining best media item to keep for %r ..." % item)
-            keep_score = 0
-            keep_id = None
-
-            if cfg['FIND_DUPLICATE_FILEPATHS_ONLY']:
-                # select lowest id to keep
-                for media_id, part_info in parts.items():
-                    if keep_score == 0 and keep_id is None:
-                        keep_score = int(part_info['id'])
-                        keep_id = media_id
-                    elif int(part_info['id']) < keep_score:
-                        keep_score = part_info['id']
-                        keep_id = media_id
-            else:
-                # select highest score to keep
-                for media_id, part_info in parts.items():
-                    if int(part_info['score']) > keep_score:
-                        keep_score = part_info['score']
-                        keep_id = media_id
-
-            if keep_id:
-                # delete other items
-                write_decision(title=item)
-                for media_id, part_info in parts.items():
-                    if media_id == keep_id:
-                        print("\tKeeping  : %r - %r" % (media_id, part_info['file']))
-                        write_decision(keeping=part_info)
-                    else:
-                        print("\tRemoving : %r - %r" % (media_id, part_info['file']))
-                        if should_skip(part_info['file']):
-                            print("\tSkipping removal of this item as there is a match in SKIP_LIST")
-                            continue
-                        delete_item(part_info['show_key'], media_id)
-                        write_decision(removed=part_info)
-                        time.sleep(2)
+            # process sections
+            print("Finding dupes...")
+            # dupes Auto Delete mode or a plan would remove nothing of are dropped before their metadata is fetched
+            prune_skipped = bool(cfg['SKIP_LIST']) and (args.command == 'plan' or
+                                                        (args.command == 'run' and cfg['AUTO_DELETE']))
+            process_later = scan_sections(args.full or args.command == 'snapshot', prune_skipped)
+
+            if args.command == 'plan':
+                write_plan(process_later, args.plan_file)
+                hold_scans(args.plan_file)
+            elif args.command == 'snapshot':
+                # a snapshot is only looked at, the next incremental run still has to see every dupe it found
+                write_snapshot(process_later, args.snapshot_file)
+            elif args.command == 'review':
+                write_review(process_later, args.review_file)
+                hold_scans(args.review_file)
             else:
-                print("Unable to determine best media item to keep for %r", item)
+                # process processed items
+                process_titles(process_later, checkpoint.decided)
+
+        # wait for outstanding deletions, writing the decisions as they are confirmed
+        flush_decisions(wait=True)
+        for server in servers:
+            server.deleter.shutdown()
+        if decision_writer is not None:
+            decision_writer.close()
+        if args.command == 'run':
+            advance_scans(finished_scans())
+        elif args.command == 'apply':
+            release_scans(args.plan_file)
+        elif args.command == 'apply-review':
+            release_scans(args.review_file)
+        if file_remover is not None:
+            file_remover.shutdown()
+    except BaseException:
+        # stop deleting, the deletions not sent yet are left to --resume; the deleters are joined first, so every
+        # confirmed deletion has been recorded before the checkpoint is closed
+        for server in servers:
+            server.deleter.cancel()
+        # write the decisions whose removals were all sent, with the removals Plex confirmed
+        flush_decisions(wait=True)
+        if decision_writer is not None:
+            decision_writer.close()
+        if file_remover is not None:
+            file_remover.shutdown()
+        # keep the checkpoint around for --resume
+        if checkpoint is not None:
+            checkpoint.close()
+        raise
+    if checkpoint is not None:
+        checkpoint.close(remove=True)
+    if args.command not in ('plan', 'snapshot', 'review'):
+        print()
+        for server in servers:
+            print("%s%s" % ('%s: ' % server.name if len(servers) > 1 else '', server.deleter.summary()))
+        if file_remover is not None:
+            print(file_remover.summary())
+    print_metrics()
+    if cfg['METRICS_FILE']:
+        metrics.write(cfg['METRICS_FILE'])
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import logging
+import os
+from operator import attrgetter
+
+from matching import GlobSet
+
+log = logging.getLogger("Plex_Dupefinder")
+
+# numpy takes longer to import than most runs spend scoring small libraries, so it is only imported by get_numpy(),
+# the first time enough parts are scored; None until then, False when it is not installed
+numpy = None
+
+# below this many parts building numpy arrays costs more than it saves
+NUMPY_MIN_PARTS = 64
+
+
+def get_numpy():
+    """ Returns the numpy module, importing it on first use, or None when it is not installed. """
+    global numpy
+    if numpy is None:
+        try:
+            import numpy as module
+        except ImportError:
+            module = False
+        numpy = module
+    return numpy or None
+
+# media part fields score_batch reads, one column each
+BATCH_COLUMNS = ('audio_codec', 'video_codec', 'video_resolution', 'file', 'video_bitrate', 'video_duration',
+                 'video_width', 'video_height', 'audio_channels', 'file_size')
+
+SCORING_KEYS = ('AUDIO_CODEC_SCORES', 'VIDEO_CODEC_SCORES', 'VIDEO_RESOLUTION_SCORES', 'FILENAME_SCORES',
+                'SCORE_FILESIZE')
+
+
+def scoring_config_hash(config):
+    """ Hash of every setting that influences a score, so stored scores can be invalidated when any changes. """
+    scoring_config = {key: config[key] for key in SCORING_KEYS}
+    return hashlib.sha1(json.dumps(scoring_config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+############################################################
+# SCORER
+############################################################
+
+
+class MediaScorer:
+    """
+    Scores media parts (see media.MediaPart) against the *_SCORES settings of a config.
+
+    Everything that only depends on the config (lowercased codec/resolution lookups, the filename globs) is
+    prepared once here, so scoring a part is a handful of dict lookups and a single GlobSet pass per file.
+    """
+
+    def __init__(self, config):
+        self.audio_codec_scores = self._build_lookup(config['AUDIO_CODEC_SCORES'])
+        self.video_codec_scores = self._build_lookup(config['VIDEO_CODEC_SCORES'])
+        self.video_resolution_scores = self._build_lookup(config['VIDEO_RESOLUTION_SCORES'])
+        self.filename_scores = [(filename_keyword, int(keyword_score))
+                                for filename_keyword, keyword_score in config['FILENAME_SCORES'].items()]
+        self.filename_globs = GlobSet(filename_keyword.lower() for filename_keyword, _ in self.filename_scores)
+        self.score_filesize = config['SCORE_FILESIZE']
+
+    @staticmethod
+    def _build_lookup(scores):
+        # first matching entry wins, same as the old linear scan
+        lookup = {}
+        for name, name_score in scores.items():
+            lookup.setdefault(name.lower(), (str(name), int(name_score)))
+        return lookup
+
+    def filename_score(self, files, breakdown=None):
+        score = 0
+        for filename in files:
+            for pos in self.filename_globs.match(os.path.basename(filename.lower())):
+                filename_keyword, keyword_score = self.filename_scores[pos]
+                score += keyword_score
+                if breakdown is not None:
+                    breakdown.append("filename_keyword %s %+d" % (filename_keyword, keyword_score))
+        return score
+
+    def score(self, media_info):
+        score = 0
+        # score audio codec
+        codec = self.audio_codec_scores.get(media_info.audio_codec.lower())
+        if codec is not None:
+            score += codec[1]
+        # score video codec
+        codec = self.video_codec_scores.get(media_info.video_codec.lower())
+        if codec is not None:
+            score += codec[1]
+        # score video resolution
+        resolution = self.video_resolution_scores.get(media_info.video_resolution.lower())
+        if resolution is not None:
+            score += resolution[1]
+        # score filename
+        score += self.filename_score(media_info.file)
+        # add bitrate to score
+        score += int(media_info.video_bitrate) * 2
+        # add duration to score
+        score += int(media_info.video_duration) / 300
+        # add width to score
+        score += int(media_info.video_width) * 2
+        # add height to score
+        score += int(media_info.video_height) * 2
+        # add audio channels to score
+        score += int(media_info.audio_channels) * 1000
+        # add file size to score
+        if self.score_filesize:
+            score += int(media_info.file_size) / 100000
+        if log.isEnabledFor(logging.DEBUG):
+            self.log_score(media_info, int(score))
+        return int(score)
+
+    def breakdown(self, media_info):
+        """ Lists what the score of a media part is made of, as logged at DEBUG. """
+        breakdown = []
+        for name, lookup, value in (('audio_codec', self.audio_codec_scores, media_info.audio_codec),
+                                    ('video_codec', self.video_codec_scores, media_info.video_codec),
+                                    ('video_resolution', self.video_resolution_scores, media_info.video_resolution)):
+            entry = lookup.get(value.lower())
+            if entry is not None:
+                breakdown.append("%s %r %+d" % (name, entry[0], entry[1]))
+        self.filename_score(media_info.file, breakdown)
+        breakdown.append("video bitrate %+d" % (int(media_info.video_bitrate) * 2))
+        breakdown.append("video duration %+d" % (int(media_info.video_duration) / 300))
+        breakdown.append("video width %+d" % (int(media_info.video_width) * 2))
+        breakdown.append("video height %+d" % (int(media_info.video_height) * 2))
+        breakdown.append("audio channels %+d" % (int(media_info.audio_channels) * 1000))
+        if self.score_filesize:
+            breakdown.append("total file size %+d" % (int(media_info.file_size) / 100000))
+        return breakdown
+
+    def log_score(self, media_info, score):
+        # logged as a single line
+        log.debug("Scored %d for media item %r: %s", score, media_info.id, ', '.join(self.breakdown(media_info)))
+
+    @staticmethod
+    def _categorical(column, lookup):
+        # every distinct value becomes a code into a table holding its score, looked up once
+        code_of = {}
+        table = []
+        for value in set(column):
+            entry = lookup.get(value.lower())
+            code_of[value] = len(table)
+            table.append(entry[1] if entry is not None else 0)
+        return [code_of[value] for value in column], table
+
+    def score_batch(self, media_infos, log_scores=True):
+        """
+        Scores many media parts in one columnar pass, returning the scores in order. Gives the same scores as
+        score(), with numpy when it is installed and in plain Python otherwise.
+
+        With DEBUG logging (and log_scores) how the score of every part was built up is logged afterwards, the scores
+        themselves are still computed in one pass.
+        """
+        scores = self._score_columns(media_infos)
+        if log_scores and log.isEnabledFor(logging.DEBUG):
+            for media_info, score in zip(media_infos, scores):
+                self.log_score(media_info, score)
+        return scores
+
+    def _score_columns(self, media_infos):
+        if not media_infos:
+            return []
+
+        (audio_codecs, video_codecs, resolutions, files, bitrates, durations, widths, heights, channels,
+         sizes) = (list(map(attrgetter(key), media_infos)) for key in BATCH_COLUMNS)
+        audio_codes, audio_table = self._categorical(audio_codecs, self.audio_codec_scores)
+        video_codes, video_table = self._categorical(video_codecs, self.video_codec_scores)
+        resolution_codes, resolution_table = self._categorical(resolutions, self.video_resolution_scores)
+        if self.filename_scores:
+            filename_scores = [self.filename_score(part_files) for part_files in files]
+        else:
+            filename_scores = [0] * len(files)
+
+        numpy = get_numpy() if len(media_infos) >= NUMPY_MIN_PARTS else None
+        if numpy is not None:
+            def column(values):
+                return numpy.array(values, dtype=numpy.int64)
+
+            # summed in the same order as score(), so the float additions round the same way
+            score = (column(audio_table)[column(audio_codes)] + column(video_table)[column(video_codes)] +
+                     column(resolution_table)[column(resolution_codes)] + column(filename_scores) +
+                     column(bitrates) * 2)
+            score = score + column(durations) / 300
+            score = score + column(widths) * 2
+            score = score + column(heights) * 2
+            score = score + column(channels) * 1000
+            if self.score_filesize:
+                score = score + column(sizes) / 100000
+            return score.astype(numpy.int64).tolist()
+
+        scores = []
+        for pos in range(len(media_infos)):
+            score = (audio_table[audio_codes[pos]] + video_table[video_codes[pos]] +
+                     resolution_table[resolution_codes[pos]] + filename_scores[pos] + int(bitrates[pos]) * 2)
+            score += int(durations[pos]) / 300
+            score += int(widths[pos]) * 2
+            score += int(heights[pos]) * 2
+            score += int(channels[pos]) * 1000
+            if self.score_filesize:
+                score += int(sizes[pos]) / 100000
+            scores.append(int(score))
+        return scores
+
+
+############################################################
+# WINNER SELECTION
+############################################################
+
+
+def grouped_argmax(groups, values, minimum=None):
+    """
+    Picks the winner of every group: the position of the first of its highest values. groups and values are
+    parallel sequences. Returns {group: position}, with None for groups whose highest value is not above minimum.
+    """
+    numpy = get_numpy() if len(values) >= NUMPY_MIN_PARTS else None
+    if numpy is not None:
+        group_codes = {}
+        codes = numpy.fromiter((group_codes.setdefault(group, len(group_codes)) for group in groups),
+                               dtype=numpy.int64, count=len(values))
+        value_array = numpy.asarray(values)
+        # sorted by group, then highest value, then position, the first entry of every group wins
+        order = numpy.lexsort((numpy.arange(len(values)), -value_array, codes))
+        sorted_codes = codes[order]
+        firsts = order[numpy.concatenate(([True], sorted_codes[1:] != sorted_codes[:-1]))]
+        winners = dict(zip(group_codes, [None] * len(group_codes)))
+        group_list = list(group_codes)
+        for code, pos in zip(codes[firsts].tolist(), firsts.tolist()):
+            if minimum is None or values[pos] > minimum:
+                winners[group_list[code]] = pos
+        return winners
+
+    winners = {}
+    best = {}
+    for pos, (group, value) in enumerate(zip(groups, values)):
+        if group not in best:
+            winners[group] = None
+            best[group] = minimum
+        if best[group] is None or value > best[group]:
+            best[group] = value
+            winners[group] = pos
+    return winners
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import logging
+import threading
+
+import requests
+from plexapi.server import PlexServer
+from requests.adapters import HTTPAdapter
+
+from cache import MediaInfoCache
+from deletion import DeletionExecutor
+
+log = logging.getLogger("Plex_Dupefinder")
+
+
+############################################################
+# SERVER
+############################################################
+
+
+class Server:
+    """
+    A Plex server being scanned, with its own pooled session, PlexServer connection, deletion executor and media
+    info cache. path_mappings translate the file paths it reports to local ones.
+    """
+
+    def __init__(self, name, url, token, libraries, config, metrics, cache_filename=None, score_hash=None,
+                 path_mappings=None):
+        self.name = name
+        self.url = url
+        self.token = token
+        self.libraries = libraries
+        self.path_mappings = path_mappings or {}
+
+        # pooled so every section/metadata/delete worker can keep its own connection alive
+        self.session = requests.Session()
+        pool_size = max(config['METADATA_WORKERS'] + config['SECTION_WORKERS'], config['DELETE_WORKERS'], 10)
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=pool_size))
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=pool_size))
+        self.session.hooks['response'].append(metrics.record_response)
+
+        self.plex = PlexServer(url, token, session=self.session)
+        self.deleter = DeletionExecutor(self.session, url, token, workers=config['DELETE_WORKERS'],
+                                        rate=config['DELETE_RATE_LIMIT'], retries=config['DELETE_RETRIES'],
+                                        metrics=metrics)
+
+        self.media_cache = None
+        if cache_filename:
+            try:
+                self.media_cache = MediaInfoCache(cache_filename, config['CACHE_MAX_ENTRIES'], score_hash)
+            except Exception:
+                log.exception("Exception opening media info cache %r, continuing without it", cache_filename)
+
+        self._sections = None
+        self._sections_lock = threading.Lock()
+
+    def section(self, plex_section_name):
+        # the library listing is fetched once and shared by every section lookup
+        with self._sections_lock:
+            if self._sections is None:
+                self._sections = {section.title.lower().strip(): section for section in self.plex.library.sections()}
+        return self._sections[plex_section_name.lower().strip()]
+
+    def label(self, text):
+        """ Prefixes text (a library, title or id) with the server name, when this is a named server. """
+        return '%s/%s' % (self.name, text) if self.name else text
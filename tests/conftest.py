@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules of the tool are top-level modules of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
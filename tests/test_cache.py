@@ -0,0 +1,67 @@
+"""
+MediaInfoCache: entries go stale with the files, updatedAt or scoring config, and the least recently used are
+evicted first.
+"""
+import pytest
+
+from cache import MediaInfoCache
+
+INFO = {'id': 1, 'video_codec': 'h264', 'file': ['/data/movie.mkv'], 'file_size': 100}
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'cache.db')
+
+
+def test_entry_survives_reopening(cache_path):
+    cache = MediaInfoCache(cache_path, 10, 'hash')
+    cache.put(1, ['/data/movie.mkv'], 1000, dict(INFO, score=42, show_key='/library/metadata/1'))
+    cache.close()
+
+    cache = MediaInfoCache(cache_path, 10, 'hash')
+    assert cache.contains(1, ['/data/movie.mkv'], 1000)
+    # show_key belongs to the scan, not the media item
+    assert cache.get(1, ['/data/movie.mkv'], 1000) == dict(INFO, score=42)
+    cache.close()
+
+
+def test_changed_item_is_stale(cache_path):
+    cache = MediaInfoCache(cache_path, 10, 'hash')
+    cache.put(1, ['/data/movie.mkv'], 1000, INFO)
+    assert cache.get(1, ['/data/movie.mkv'], 1001) is None
+    assert cache.get(1, ['/data/movie.2160p.mkv'], 1000) is None
+    assert cache.get(1, ['/data/movie.mkv', '/data/movie.cd2.mkv'], 1000) is None
+    assert not cache.contains(2, ['/data/movie.mkv'], 1000)
+    assert cache.get(1, ['/data/movie.mkv'], 1000) == INFO
+    cache.close()
+
+
+def test_score_is_dropped_with_another_scoring_config(cache_path):
+    cache = MediaInfoCache(cache_path, 10, 'old')
+    cache.put(1, ['/data/movie.mkv'], 1000, INFO)
+    cache.put_score(1, 42)
+    assert cache.get(1, ['/data/movie.mkv'], 1000)['score'] == 42
+    cache.close()
+
+    cache = MediaInfoCache(cache_path, 10, 'new')
+    assert cache.get(1, ['/data/movie.mkv'], 1000) == INFO
+    cache.close()
+
+
+def test_evicts_least_recently_used(cache_path, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr('cache.time.time', lambda: now[0])
+    cache = MediaInfoCache(cache_path, 3, 'hash')
+    for media_id in range(1, 6):
+        now[0] += 1
+        cache.put(media_id, ['/data/%d.mkv' % media_id], 1000, dict(INFO, id=media_id))
+    # reading an entry keeps it
+    now[0] += 1
+    cache.get(1, ['/data/1.mkv'], 1000)
+    cache.close()
+
+    cache = MediaInfoCache(cache_path, 3, 'hash')
+    assert [media_id for media_id in range(1, 6)
+            if cache.contains(media_id, ['/data/%d.mkv' % media_id], 1000)] == [1, 4, 5]
+    cache.close()
@@ -0,0 +1,63 @@
+"""
+Checkpoint: what a run recorded is replayed by the next one with resume, a line cut off by a crash included.
+"""
+from checkpoint import Checkpoint
+from media import MediaPart
+
+
+def record_run(path):
+    checkpoint = Checkpoint(path)
+    part_info = MediaPart(id=11, file=['/data/movie.mkv'], file_size=100, score=42, show_key='/library/metadata/1')
+    checkpoint.record_item('Movies', 1, 'Movie', {11: part_info})
+    checkpoint.record_item('Movies', 2, 'Other Movie', {12: MediaPart(id=12), 13: MediaPart(id=13)})
+    checkpoint.record_section('Movies')
+    checkpoint.record_decided('Movie')
+    checkpoint.record_deleted(12)
+    checkpoint.close()
+    return part_info
+
+
+def test_resume_replays_the_run(tmp_path):
+    path = str(tmp_path / 'checkpoint.jsonl')
+    part_info = record_run(path)
+
+    checkpoint = Checkpoint(path, resume=True)
+    assert checkpoint.sections_done == {'Movies'}
+    assert checkpoint.items_done == {('Movies', 1), ('Movies', 2)}
+    assert checkpoint.titles['Movie'][11].to_dict() == part_info.to_dict()
+    assert sorted(checkpoint.titles['Other Movie']) == [12, 13]
+    assert checkpoint.decided == {'Movie'}
+    assert checkpoint.deleted == {12}
+
+    # carried on in the same file, read back by the run after that
+    checkpoint.record_deleted(13)
+    checkpoint.close()
+    checkpoint = Checkpoint(path, resume=True)
+    assert checkpoint.deleted == {12, 13}
+    checkpoint.close()
+
+
+def test_resume_ignores_a_cut_off_line(tmp_path):
+    path = str(tmp_path / 'checkpoint.jsonl')
+    record_run(path)
+    with open(path, 'a') as fp:
+        fp.write('{"deleted": 1')
+
+    checkpoint = Checkpoint(path, resume=True)
+    assert checkpoint.deleted == {12}
+    assert checkpoint.decided == {'Movie'}
+    checkpoint.close()
+
+
+def test_fresh_run_starts_over(tmp_path):
+    path = str(tmp_path / 'checkpoint.jsonl')
+    record_run(path)
+
+    checkpoint = Checkpoint(path)
+    assert not checkpoint.titles and not checkpoint.deleted
+    checkpoint.close(remove=True)
+    assert not tmp_path.joinpath('checkpoint.jsonl').exists()
+    # nothing to resume from
+    checkpoint = Checkpoint(path, resume=True)
+    assert not checkpoint.titles
+    checkpoint.close()
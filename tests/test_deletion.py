@@ -0,0 +1,69 @@
+"""
+TokenBucket rate limiting, and the files FileRemover removes (or would remove with a dry run).
+"""
+import time
+
+from deletion import FileRemover, TokenBucket
+from media import MediaPart
+
+
+def timed_acquires(bucket, count):
+    started = time.monotonic()
+    for _ in range(count):
+        bucket.acquire()
+    return time.monotonic() - started
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(20, capacity=5)
+    assert timed_acquires(bucket, 5) < 0.05
+    # the next 4 wait a twentieth of a second each
+    assert 0.15 <= timed_acquires(bucket, 4) < 0.5
+
+
+def test_token_bucket_refills_while_idle():
+    bucket = TokenBucket(20, capacity=2)
+    timed_acquires(bucket, 2)
+    time.sleep(0.1)
+    assert timed_acquires(bucket, 2) < 0.05
+
+
+def test_token_bucket_rate_zero_does_not_limit():
+    assert timed_acquires(TokenBucket(0), 1000) < 0.05
+
+
+def write_files(directory, sizes):
+    paths = []
+    for pos, size in enumerate(sizes):
+        path = directory / ('movie.cd%d.mkv' % (pos + 1))
+        path.write_bytes(b'x' * size)
+        paths.append(str(path))
+    return paths
+
+
+def test_remover_removes_mapped_files_except_kept_ones(tmp_path):
+    write_files(tmp_path, [10, 20, 30])
+    part_info = MediaPart(id=1, file=['/data/movie.cd1.mkv', '/data/movie.cd2.mkv', '/data/movie.cd3.mkv'],
+                          file_size=60)
+    remover = FileRemover(workers=2)
+    remover.submit(part_info, {'/data': str(tmp_path)}, keep_paths=[str(tmp_path / 'movie.cd3.mkv')])
+    remover.submit(MediaPart(id=2, file=['/data/gone.mkv']), {'/data': str(tmp_path)})
+    remover.shutdown()
+
+    assert [path.name for path in tmp_path.iterdir()] == ['movie.cd3.mkv']
+    assert (remover.removed, remover.reclaimed, remover.shared, remover.missing) == (2, 30, 1, 1)
+
+
+def test_remover_dry_run_totals_what_would_be_removed(tmp_path):
+    paths = write_files(tmp_path, [10, 20])
+    remover = FileRemover(dry_run=True)
+    # every file goes, counted at the size Plex reported
+    remover.submit(MediaPart(id=1, file=paths, file_size=1000))
+    # only one file goes, counted at its size on disk
+    remover.submit(MediaPart(id=2, file=paths, file_size=1000), keep_paths=paths[:1])
+    # only kept files, nothing would be freed
+    remover.submit(MediaPart(id=3, file=paths, file_size=1000), keep_paths=paths)
+    remover.shutdown()
+
+    assert (remover.removed, remover.reclaimed, remover.shared) == (3, 1020, 3)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['movie.cd1.mkv', 'movie.cd2.mkv']
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Regression tests of whole runs against the fake_plex stand-in server: plan and apply, an interrupted run carried on
+with --resume, pruning dupes matched by SKIP_LIST, the incremental scan times and removing files from disk.
+
+Every test copies the tool to a temporary directory, configures it against a fresh fake server and runs it in a
+subprocess, the way cron would.
+
+Usage: python3 -m pytest -q tests
+"""
+import glob
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+from bench_e2e import build_config  # noqa: E402
+from fake_plex import FakeLibrary, FakePlexServer  # noqa: E402
+
+METADATA_ENDPOINT = ('GET', '/library/metadata/{id}')
+DELETE_ENDPOINT = ('DELETE', '/library/metadata/{id}/media/{id}')
+
+
+@pytest.fixture
+def plex():
+    servers = []
+
+    def start(items=20, copies=2, latency=0.0, same_path=False):
+        server = FakePlexServer(FakeLibrary(items, copies, same_path=same_path), latency=latency)
+        server.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def setup_tool(work_dir, server, **overrides):
+    for filename in glob.glob(os.path.join(REPO_DIR, '*.py')):
+        shutil.copy(filename, str(work_dir))
+    settings = {'DELETE_RATE_LIMIT': 0, 'LOG_LEVEL': 'INFO'}
+    settings.update(overrides)
+    with open(os.path.join(str(work_dir), 'config.json'), 'w') as fp:
+        json.dump(build_config(server.url, settings), fp)
+
+
+def tool_command(work_dir, args):
+    return [sys.executable, os.path.join(str(work_dir), 'plex_dupefinder.py')] + list(args)
+
+
+def run_tool(work_dir, *args, **kwargs):
+    process = subprocess.run(tool_command(work_dir, args), cwd=str(work_dir), stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, universal_newlines=True, timeout=120, **kwargs)
+    assert process.returncode == 0, process.stdout + process.stderr
+    return process.stdout
+
+
+def read_lines(path):
+    with open(path, 'r') as fp:
+        return [json.loads(line) for line in fp if line.strip()]
+
+
+def decided_titles(work_dir):
+    with open(os.path.join(str(work_dir), 'decisions.log'), 'r') as fp:
+        return [line[len('Title    : '):].strip() for line in fp if line.startswith('Title    : ')]
+
+
+def load_state(work_dir):
+    path = os.path.join(str(work_dir), 'state.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as fp:
+        return json.load(fp)
+
+
+def test_plan_then_apply(plex, tmp_path):
+    server = plex(items=20, copies=3)
+    setup_tool(tmp_path, server, INCREMENTAL_SCAN=True)
+
+    run_tool(tmp_path, 'plan')
+    plan = read_lines(str(tmp_path / 'plan.jsonl'))
+    assert len(plan) == 20
+    assert sum(len(entry['remove']) for entry in plan) == 40
+    assert server.requests[DELETE_ENDPOINT] == 0
+    # the scan only counts for incremental runs once the plan is applied
+    assert not load_state(tmp_path)['sections']
+
+    output = run_tool(tmp_path, 'apply')
+    assert "Deleted 40 media item(s), 0 failed" in output
+    assert server.library.deleted == {part['id'] for entry in plan for part in entry['remove']}
+    assert sorted(decided_titles(tmp_path)) == sorted(entry['title'] for entry in plan)
+    assert set(load_state(tmp_path)['sections']) == {'Movies', 'TV'}
+
+
+def test_snapshot_leaves_incremental_state(plex, tmp_path):
+    server = plex()
+    setup_tool(tmp_path, server, INCREMENTAL_SCAN=True)
+
+    run_tool(tmp_path, 'snapshot')
+    assert len(read_lines(str(tmp_path / 'snapshot.jsonl'))) == 20
+    assert load_state(tmp_path) is None
+    assert not os.path.exists(str(tmp_path / 'decisions.log'))
+
+
+def test_resume_after_sigterm(plex, tmp_path):
+    server = plex(items=60, latency=0.02)
+    setup_tool(tmp_path, server, DELETE_RATE_LIMIT=20)
+
+    process = subprocess.Popen(tool_command(tmp_path, []), cwd=str(tmp_path), stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while len(server.delete_times) < 20 and time.time() < deadline:
+        time.sleep(0.01)
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(timeout=30) == 128 + signal.SIGTERM
+
+    # only the deletions in flight were finished, and each is in the checkpoint and decisions.log
+    deleted = len(server.delete_times)
+    assert 20 <= deleted < 40
+    checkpoint = read_lines(str(tmp_path / 'checkpoint.jsonl'))
+    assert len([entry for entry in checkpoint if 'deleted' in entry]) == deleted
+    assert len(decided_titles(tmp_path)) == deleted
+
+    output = run_tool(tmp_path, '--resume')
+    assert "Deleted %d media item(s), 0 failed" % (60 - deleted) in output
+    assert server.requests[DELETE_ENDPOINT] == 60
+    titles = decided_titles(tmp_path)
+    assert len(titles) == len(set(titles)) == 60
+    assert not os.path.exists(str(tmp_path / 'checkpoint.jsonl'))
+
+
+def test_skip_list_prunes_before_fetching_metadata(plex, tmp_path):
+    full_dir = tmp_path / 'full'
+    skip_dir = tmp_path / 'skip'
+    full_dir.mkdir()
+    skip_dir.mkdir()
+    full_server = plex()
+    skip_server = plex()
+    setup_tool(full_dir, full_server, METADATA_BATCH_SIZE=1)
+    setup_tool(skip_dir, skip_server, METADATA_BATCH_SIZE=1, SKIP_LIST=['/data/Movies/'])
+
+    run_tool(full_dir, 'plan')
+    output = run_tool(skip_dir, 'plan')
+    assert "Skipped 10 dupes for section 'Movies'" in output
+
+    # movies were not fetched, episodes were planned just the same
+    assert full_server.requests[METADATA_ENDPOINT] == 20
+    assert skip_server.requests[METADATA_ENDPOINT] == 10
+    full_plan = read_lines(str(full_dir / 'plan.jsonl'))
+    skip_plan = read_lines(str(skip_dir / 'plan.jsonl'))
+    assert skip_plan == [entry for entry in full_plan if entry['title'].startswith('Show')]
+
+
+def write_media_files(server, media_dir):
+    # the files of every item on disk, under /data mapped to media_dir
+    for key in range(1, server.library.items + 1):
+        path = server.library.item_xml(key).split('file="', 1)[1].split('"', 1)[0]
+        local_path = media_dir / os.path.relpath(path, '/data')
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        local_path.write_text('media')
+
+
+def test_delete_files_keeps_shared_paths(plex, tmp_path):
+    server = plex(items=6, same_path=True)
+    media_dir = tmp_path / 'media'
+    write_media_files(server, media_dir)
+    setup_tool(tmp_path, server, FIND_DUPLICATE_FILEPATHS_ONLY=True, DELETE_FILES=True,
+               PATH_MAPPINGS={'/data': str(media_dir)})
+
+    output = run_tool(tmp_path)
+    assert "Deleted 6 media item(s), 0 failed" in output
+    run_tool(tmp_path, 'delete-files')
+    # every removed copy shared its file with the kept one
+    assert len([path for path in media_dir.rglob('*') if path.is_file()]) == 6
+
+
+def test_delete_files_dry_run_counts_only_removed_files(plex, tmp_path):
+    server = plex(items=6, same_path=True)
+    media_dir = tmp_path / 'media'
+    write_media_files(server, media_dir)
+    setup_tool(tmp_path, server, FIND_DUPLICATE_FILEPATHS_ONLY=True, DELETE_FILES=True, DELETE_FILES_DRY_RUN=True,
+               PATH_MAPPINGS={'/data': str(media_dir)})
+
+    output = run_tool(tmp_path)
+    # the files of the removed copies are the kept ones, nothing would be freed
+    assert "Dry run, would have removed 0 file(s), reclaiming 0.00 GB, 6 kept" in output
+    assert len([path for path in media_dir.rglob('*') if path.is_file()]) == 6
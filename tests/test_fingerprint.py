@@ -0,0 +1,71 @@
+"""
+FingerprintIndex: media items are grouped by the sizes of their parts, and only those sharing their sizes are
+hashed. Also the path mapping and partial hash it builds on.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from fingerprint import FingerprintIndex, map_path, partial_hash
+
+BLOCK_SIZE = 16
+
+
+def test_map_path_uses_the_longest_prefix():
+    mappings = {'/data': '/mnt/data', '/data/tv': '/mnt/tv'}
+    assert map_path('/data/tv/show.mkv', mappings) == '/mnt/tv/show.mkv'
+    assert map_path('/data/movie.mkv', mappings) == '/mnt/data/movie.mkv'
+    assert map_path('/other/movie.mkv', mappings) == '/other/movie.mkv'
+
+
+def test_partial_hash_reads_only_the_ends(tmp_path):
+    def hash_of(name, content):
+        path = tmp_path / name
+        path.write_bytes(content)
+        return partial_hash(str(path), BLOCK_SIZE)
+
+    original = hash_of('original', b'a' * 16 + b'b' * 32 + b'c' * 16)
+    assert hash_of('middle', b'a' * 16 + b'x' * 32 + b'c' * 16) == original
+    assert hash_of('end', b'a' * 16 + b'b' * 32 + b'c' * 15 + b'x') != original
+    assert hash_of('longer', b'a' * 16 + b'b' * 33 + b'c' * 16) != original
+    assert hash_of('empty', b'') != hash_of('short', b'a')
+
+
+@pytest.fixture
+def write(tmp_path):
+    def write_file(name, content):
+        (tmp_path / name).write_bytes(content)
+        return '/data/' + name
+    return write_file
+
+
+def test_groups_media_items_with_the_same_content(tmp_path, write):
+    index = FingerprintIndex({'/data': str(tmp_path)}, BLOCK_SIZE)
+    copy = b'movie' * 20
+    index.add('copy 1', [write('a.mkv', copy)], [len(copy)])
+    index.add('copy 2', [write('b.mkv', copy)], [len(copy)])
+    index.add('same size', [write('c.mkv', b'other' * 20)], [len(copy)])
+    index.add('own size', [write('d.mkv', b'unique')], [6])
+    # missing files are left out, files without a size are not indexed at all
+    index.add('missing', ['/data/missing.mkv'], [len(copy)])
+    index.add('no size', [write('e.mkv', copy)], [0])
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert index.groups(executor) == [['copy 1', 'copy 2']]
+    assert index.media_items == 5
+    assert index.sharing_size == 4
+    # own size was never read
+    assert index.files_read == 3
+    assert index.bytes_read == 3 * 2 * BLOCK_SIZE
+
+
+def test_multi_part_media_items_match_on_every_part(tmp_path, write):
+    index = FingerprintIndex({'/data': str(tmp_path)}, BLOCK_SIZE)
+    index.add(1, [write('1.cd1.mkv', b'one' * 10), write('1.cd2.mkv', b'two' * 10)], [30, 30])
+    index.add(2, [write('2.cd1.mkv', b'one' * 10), write('2.cd2.mkv', b'two' * 10)], [30, 30])
+    index.add(3, [write('3.cd1.mkv', b'one' * 10), write('3.cd2.mkv', b'six' * 10)], [30, 30])
+    # the same parts in another order are other content
+    index.add(4, [write('4.cd1.mkv', b'two' * 10), write('4.cd2.mkv', b'one' * 10)], [30, 30])
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert index.groups(executor) == [[1, 2]]
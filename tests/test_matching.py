@@ -0,0 +1,54 @@
+"""
+GlobSet and SubstringSet against fnmatch and the in operator they replace.
+"""
+import random
+from fnmatch import fnmatch
+
+import pytest
+
+from matching import AhoCorasick, GlobSet, SubstringSet
+
+TOKENS = ['remux', 'bluray', 'web', 'web-dl', 'x264', 'x265', '1080p', '720p', 'dvd', 'proper']
+
+
+def random_name(rng):
+    return '.'.join(rng.sample(TOKENS, rng.randint(1, 4))) + rng.choice(['.mkv', '.mp4', '.avi'])
+
+
+def test_glob_set_matches_like_fnmatch():
+    rng = random.Random(42)
+    globs = ['*', '*.mkv', '*remux*', '*web?dl*', '*x26[45]*', '*[!a-z]720p*', '*.m??', '*1080p*bluray*', '*dvd',
+             '*remux*']
+    globs += ['*' + '*'.join(rng.sample(TOKENS, rng.randint(1, 2))) + '*' for _ in range(50)]
+    glob_set = GlobSet(globs)
+    for _ in range(500):
+        name = random_name(rng)
+        assert glob_set.match(name) == [pos for pos, glob in enumerate(globs) if fnmatch(name, glob)], name
+
+
+def test_glob_set_without_globs():
+    assert GlobSet([]).match('movie.mkv') == []
+
+
+def test_substring_set_matches_like_in():
+    rng = random.Random(7)
+    substrings = ['/data/movies/', '/data/tv/show', 'sample', 'ample', '.nfo']
+    substring_set = SubstringSet(substrings)
+    for _ in range(500):
+        text = '/data/' + '/'.join(rng.choice(['movies', 'tv', 'show', 'sample', 'extras', 'a.nfo'])
+                                   for _ in range(rng.randint(1, 4)))
+        assert (text in substring_set) == any(substring in text for substring in substrings), text
+
+
+def test_substring_set_empty_substring_matches_everything():
+    assert '' in SubstringSet([''])
+    assert '/any/path' in SubstringSet(['', '/other'])
+    assert '/any/path' not in SubstringSet([])
+
+
+def test_aho_corasick_search_finds_overlapping_keywords():
+    index = AhoCorasick(['he', 'she', 'his', 'hers'])
+    assert index.search('ushers') == {0, 1, 3}
+    assert not index.contains_any('hi')
+    with pytest.raises(ValueError):
+        AhoCorasick([''])
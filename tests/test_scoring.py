@@ -0,0 +1,71 @@
+"""
+MediaScorer.score_batch against score, and grouped_argmax against picking the winners one by one, with numpy and
+in plain Python.
+"""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'benchmarks'))
+
+import scoring  # noqa: E402
+from bench_scoring import build_config, build_media_info, legacy_score  # noqa: E402
+from media import MediaPart  # noqa: E402
+from scoring import MediaScorer, grouped_argmax  # noqa: E402
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        # get_numpy() takes False for numpy not being installed
+        monkeypatch.setattr(scoring, 'numpy', False)
+    return request.param
+
+
+def build_parts(seed, count):
+    rng = random.Random(seed)
+    config = build_config(rng, 50)
+    media_infos = [build_media_info(rng) for _ in range(count)]
+    return config, media_infos, [MediaPart.from_dict(media_info) for media_info in media_infos]
+
+
+@pytest.mark.parametrize('count', [1, scoring.NUMPY_MIN_PARTS - 1, 500])
+@pytest.mark.parametrize('score_filesize', [True, False])
+def test_score_batch_matches_score(backend, count, score_filesize):
+    config, media_infos, parts = build_parts(count, count)
+    config['SCORE_FILESIZE'] = score_filesize
+    scorer = MediaScorer(config)
+    scores = [scorer.score(part) for part in parts]
+    assert scores == [legacy_score(config, media_info) for media_info in media_infos]
+    assert scorer.score_batch(parts) == scores
+
+
+def test_score_batch_of_nothing():
+    assert MediaScorer(build_parts(0, 0)[0]).score_batch([]) == []
+
+
+def reference_argmax(groups, values, minimum=None):
+    winners = {}
+    for group in dict.fromkeys(groups):
+        positions = [pos for pos, pos_group in enumerate(groups) if pos_group == group]
+        best = max(positions, key=lambda pos: (values[pos], -pos))
+        winners[group] = best if minimum is None or values[best] > minimum else None
+    return winners
+
+
+@pytest.mark.parametrize('minimum', [None, 0, 5])
+def test_grouped_argmax_matches_reference(backend, minimum):
+    rng = random.Random(3)
+    for count in (1, 10, 200):
+        # few distinct values, so ties are common and the first of them has to win
+        groups = [rng.choice('abcdefg') for _ in range(count)]
+        values = [rng.randint(-3, 8) for _ in range(count)]
+        assert grouped_argmax(groups, values, minimum) == reference_argmax(groups, values, minimum)
+
+
+def test_grouped_argmax_minimum_is_exclusive():
+    assert grouped_argmax(['a', 'a', 'b'], [1, 1, 2], minimum=1) == {'a': None, 'b': 2}
@@ -0,0 +1,87 @@
+"""
+SectionDebouncer: changes of a section are handed on once it is quiet, merged while the queue is full, and as a
+search of the whole section past max_items. Also the alerts library_changes picks them from.
+"""
+import queue
+import time
+
+import pytest
+
+from watcher import SectionDebouncer, library_changes
+
+
+@pytest.fixture
+def debouncer():
+    debouncers = []
+
+    def start(delay, queue_size=10, max_items=100):
+        debouncers.append(SectionDebouncer(delay, queue_size, max_items))
+        return debouncers[-1]
+
+    yield start
+    for started in debouncers:
+        started.stop()
+
+
+def test_hands_on_once_quiet(debouncer):
+    started = time.time()
+    batches = debouncer(0.2)
+    for rating_key in (3, 1, 2, 1):
+        batches.add('Movies', rating_key)
+        time.sleep(0.05)
+    section, keys, since = batches.queue.get(timeout=5)
+    assert (section, keys) == ('Movies', [1, 2, 3])
+    assert started <= since <= started + 0.05
+    # not before delay has passed since the last change
+    assert time.time() - since >= 0.15 + 0.2
+    assert batches.queue.empty()
+
+
+def test_flush_hands_on_right_away(debouncer):
+    batches = debouncer(60)
+    batches.add('TV', 5)
+    batches.flush('TV')
+    assert batches.queue.get(timeout=5)[:2] == ('TV', [5])
+    # nothing pending, nothing to hand on
+    batches.flush('Movies')
+    with pytest.raises(queue.Empty):
+        batches.queue.get(timeout=0.2)
+
+
+def test_too_many_items_search_the_section(debouncer):
+    batches = debouncer(0.05, max_items=3)
+    for rating_key in range(5):
+        batches.add('Movies', rating_key)
+    assert batches.queue.get(timeout=5)[:2] == ('Movies', None)
+
+
+def test_changes_merge_while_the_queue_is_full(debouncer):
+    batches = debouncer(0.01, queue_size=1)
+    batches.add('Movies', 1)
+    time.sleep(0.1)
+    batches.add('TV', 2)
+    time.sleep(0.1)
+    # waiting for room for TV, Movies changes meanwhile pile up in one batch
+    for rating_key in (3, 4):
+        batches.add('Movies', rating_key)
+        time.sleep(0.1)
+    assert [batches.queue.get(timeout=5)[:2] for _ in range(3)] == [('Movies', [1]), ('TV', [2]), ('Movies', [3, 4])]
+
+
+def test_library_changes():
+    timeline = {'type': 'timeline', 'TimelineEntry': [
+        {'identifier': 'com.plexapp.plugins.library', 'state': 5, 'type': 1, 'sectionID': 1, 'itemID': '10'},
+        # still being processed
+        {'identifier': 'com.plexapp.plugins.library', 'state': 0, 'type': 1, 'sectionID': 1, 'itemID': '11'},
+        # a season, not an episode
+        {'identifier': 'com.plexapp.plugins.library', 'state': 5, 'type': 3, 'sectionID': 2, 'itemID': '12'},
+        {'identifier': 'com.plexapp.plugins.library', 'state': 5, 'type': 4, 'sectionID': 2, 'itemID': '13'},
+    ]}
+    assert list(library_changes(timeline)) == [('1', 10), ('2', 13)]
+
+    activity = {'type': 'activity', 'ActivityNotification': [
+        {'event': 'ended', 'Activity': {'type': 'library.update.section', 'Context': {'librarySectionID': '2'}}},
+        {'event': 'started', 'Activity': {'type': 'library.update.section', 'Context': {'librarySectionID': '1'}}},
+    ]}
+    assert list(library_changes(activity)) == [('2', None)]
+    assert list(library_changes({'type': 'playing'})) == []
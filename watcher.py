@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+import logging
+import queue
+import threading
+import time
+
+log = logging.getLogger("Plex_Dupefinder")
+
+# Plex timeline entries of library items: the item types and the state of an item that finished processing
+TIMELINE_IDENTIFIER = 'com.plexapp.plugins.library'
+TIMELINE_ITEM_TYPES = (1, 4)
+TIMELINE_PROCESSED = 5
+
+# past this many changed items, a section is searched for dupes instead of fetching every item
+MAX_PENDING_ITEMS = 1000
+
+
+def library_changes(data):
+    """
+    Reads a notification of the Plex alert listener. Yields (section id, rating key) for every movie or episode that
+    finished processing and (section id, None) for every library section Plex finished scanning.
+    """
+    if data.get('type') == 'timeline':
+        for entry in data.get('TimelineEntry', []):
+            if (entry.get('identifier') == TIMELINE_IDENTIFIER and entry.get('state') == TIMELINE_PROCESSED and
+                    entry.get('type') in TIMELINE_ITEM_TYPES and entry.get('sectionID')):
+                yield str(entry['sectionID']), int(entry['itemID'])
+    elif data.get('type') == 'activity':
+        for entry in data.get('ActivityNotification', []):
+            activity = entry.get('Activity', {})
+            if entry.get('event') == 'ended' and activity.get('type') == 'library.update.section':
+                section_id = activity.get('Context', {}).get('librarySectionID')
+                if section_id:
+                    yield str(section_id), None
+
+
+############################################################
+# DEBOUNCER
+############################################################
+
+
+class SectionDebouncer:
+    """
+    Collects the items reported changed per library section and hands them on once the section has been quiet for
+    delay seconds, or as soon as Plex finished scanning it.
+
+    Batches are (section, rating keys, since) tuples put on queue, which holds at most queue_size of them. When it is
+    full the debouncer waits for room, and changes arriving meanwhile are merged into the next batch of their section
+    rather than queued up. A section with more than max_items changed items is handed on with None for the rating
+    keys, to be searched as a whole, since being when its first change arrived.
+    """
+
+    def __init__(self, delay, queue_size, max_items=MAX_PENDING_ITEMS):
+        self.delay = delay
+        self.max_items = max_items
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='debouncer', daemon=True)
+        self._thread.start()
+
+    def add(self, section, rating_key):
+        """ Records a changed item of section, never blocks so it can be called from the alert listener. """
+        with self._condition:
+            now = time.time()
+            pending = self._pending.get(section)
+            if pending is None:
+                pending = self._pending[section] = {'keys': set(), 'since': now, 'due': now + self.delay}
+            elif pending['due'] > now:
+                pending['due'] = now + self.delay
+            if pending['keys'] is not None:
+                pending['keys'].add(rating_key)
+                if len(pending['keys']) > self.max_items:
+                    pending['keys'] = None
+            self._condition.notify()
+
+    def flush(self, section):
+        """ Hands on the changes of section right away, e.g. once Plex finished scanning it. """
+        with self._condition:
+            if section in self._pending:
+                self._pending[section]['due'] = 0
+                self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    now = time.time()
+                    due = [section for section, pending in self._pending.items() if pending['due'] <= now]
+                    if due:
+                        break
+                    next_due = min((pending['due'] for pending in self._pending.values()), default=None)
+                    self._condition.wait(next_due - now if next_due is not None else None)
+                if self._stopped:
+                    return
+                batches = [(section, self._pending.pop(section)) for section in due]
+
+            # blocks while the queue is full, which is what keeps the pending changes coalescing
+            for section, pending in batches:
+                keys = sorted(pending['keys']) if pending['keys'] is not None else None
+                log.debug("Handing on %s changed item(s) of section %r",
+                          len(keys) if keys is not None else 'too many', section)
+                self.queue.put((section, keys, pending['since']))